@@ -0,0 +1,41 @@
+from contextlib import contextmanager
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        'markers',
+        'query_budget(limit): тест падает, если сделал больше limit '
+        'SQL-запросов (подготовка фикстур не считается)')
+
+
+@contextmanager
+def _query_budget(limit):
+    with CaptureQueriesContext(connection) as queries:
+        yield queries
+    if len(queries) > limit:
+        listing = '\n'.join(
+            f'{number}. {query["sql"]}'
+            for number, query in enumerate(queries.captured_queries, 1))
+        pytest.fail(
+            f'Превышен бюджет запросов: {len(queries)} > {limit}\n'
+            f'{listing}', pytrace=False)
+
+
+@pytest.fixture
+def query_budget(db):
+    """Контекстный менеджер: ``with query_budget(5): client.get(url)``."""
+    return _query_budget
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    marker = item.get_closest_marker('query_budget')
+    if marker is None:
+        yield
+        return
+    with _query_budget(*marker.args, **marker.kwargs):
+        yield
@@ -0,0 +1,53 @@
+import pytest
+from django.core.cache import cache
+
+from posts.models import Comment, Post
+from posts.tests.utils import run_on_commit
+
+
+@pytest.fixture
+def busy_feed(mixer, user, group, another_user):
+    # Фоновые задачи выполняются после коммита, которого в тесте нет
+    with run_on_commit():
+        posts = mixer.cycle(20).blend(
+            Post, author=user, group=group, image='')
+        for post in posts:
+            mixer.cycle(3).blend(Comment, post=post, author=another_user)
+    cache.clear()
+    return posts
+
+
+class TestQueryBudget:
+
+    @pytest.mark.django_db
+    @pytest.mark.query_budget(3)
+    def test_index(self, client, busy_feed):
+        client.get('/')
+
+    @pytest.mark.django_db
+    @pytest.mark.query_budget(9)
+    def test_profile(self, user_client, busy_feed):
+        user_client.get(f'/{busy_feed[0].author.username}/')
+
+    @pytest.mark.django_db
+    @pytest.mark.query_budget(8)
+    def test_post_view(self, user_client, busy_feed):
+        post = busy_feed[0]
+        user_client.get(f'/{post.author.username}/{post.id}/')
+
+    @pytest.mark.django_db
+    def test_budget_does_not_grow_with_feed(self, client, mixer, busy_feed,
+                                            query_budget):
+        with query_budget(100) as small:
+            client.get('/')
+        mixer.cycle(20).blend(Comment, post=busy_feed[1])
+        cache.clear()
+        with query_budget(len(small)):
+            client.get('/')
+
+    @pytest.mark.django_db
+    def test_server_timing_header(self, client, busy_feed):
+        response = client.get('/')
+        timing = response['Server-Timing']
+        assert 'db;dur=' in timing and 'queries' in timing, (
+            'Проверьте, что ответ содержит заголовок Server-Timing')
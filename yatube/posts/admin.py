@@ -1,28 +1,148 @@
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.urls import reverse
+from django.utils.functional import cached_property
 
+from . import search
 from .models import Comment, Follow, Group, Post
 
 
+def estimated_count(model, using):
+    """Число строк таблицы по статистике планировщика или None.
+
+    В PostgreSQL это pg_class.reltuples, в SQLite - первое число из
+    sqlite_stat1, которая появляется после ANALYZE.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute(
+                    "SELECT reltuples FROM pg_class WHERE relname = %s",
+                    [table])
+            elif connection.vendor == "sqlite":
+                cursor.execute(
+                    "SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1",
+                    [table])
+            else:
+                return None
+            row = cursor.fetchone()
+    except DatabaseError:
+        # ANALYZE ещё ни разу не запускали
+        return None
+    if row is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор, который не считает COUNT(*) по всей большой таблице.
+
+    Для списка без фильтров и поиска берётся оценка из статистики,
+    если она больше ADMIN_COUNT_ESTIMATE_THRESHOLD; отфильтрованные
+    списки и небольшие таблицы считаются точно.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_count(queryset.model, queryset.db)
+            if (estimate is not None
+                    and estimate >= settings.ADMIN_COUNT_ESTIMATE_THRESHOLD):
+                return estimate
+        return super().count
+
+
+class AutocompleteFilter(admin.FieldListFilter):
+    """Фильтр по внешнему ключу с поиском через autocomplete админки
+    вместо списка всех связанных объектов."""
+    template = "admin/autocomplete_filter.html"
+
+    def __init__(self, field, request, params, model, model_admin,
+                 field_path):
+        self.lookup_kwarg = f"{field_path}__{field.target_field.name}__exact"
+        self.lookup_val = params.get(self.lookup_kwarg)
+        super().__init__(
+            field, request, params, model, model_admin, field_path)
+        related = field.remote_field.model._meta
+        self.autocomplete_url = reverse(
+            f"{model_admin.admin_site.name}:"
+            f"{related.app_label}_{related.model_name}_autocomplete")
+        self.selected = None
+        if self.lookup_val:
+            try:
+                self.selected = related.model._default_manager.filter(
+                    pk=self.lookup_val).first()
+            except (ValueError, ValidationError):
+                pass
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        yield {
+            "selected": self.lookup_val is None,
+            "query_string": changelist.get_query_string(
+                remove=[self.lookup_kwarg]),
+            "display": "Все",
+        }
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Админка для таблиц, где полный COUNT(*) и списки всех
+    пользователей в фильтрах слишком дороги."""
+    paginator = EstimatedCountPaginator
+    # Иначе отфильтрованный список считает ещё и всю таблицу
+    show_full_result_count = False
+
+    @property
+    def media(self):
+        return super().media + AutocompleteSelect(None, self.admin_site).media
+
+
 class PostGroup(admin.ModelAdmin):
     list_display = ("title", "slug", "description")
     empty_value_display = "-пусто-"
 
 
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(LargeTableAdmin):
     list_display = ("pk", "text", "pub_date", "author", "group", "image")
+    list_select_related = ("author", "group")
     search_fields = ("text",)
     list_filter = ("pub_date",)
+    autocomplete_fields = ("author",)
     empty_value_display = "-пусто-"
 
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск идёт по полнотекстовому индексу, а не LIKE по всей таблице
+        if not search_term.strip():
+            return queryset, False
+        return search.filter_posts(queryset, search_term), False
+
 
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(LargeTableAdmin):
     list_display = ("pk", "user", "author")
-    list_filter = ("user", "author")
+    list_select_related = ("user", "author")
+    list_filter = (("user", AutocompleteFilter),
+                   ("author", AutocompleteFilter))
+    autocomplete_fields = ("user", "author")
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(LargeTableAdmin):
     list_display = ("created", "text", "author", "post")
-    list_filter = ("author",)
+    list_select_related = ("author", "post")
+    list_filter = (("author", AutocompleteFilter),)
+    autocomplete_fields = ("author", "post")
 
 
 admin.site.register(Follow, FollowAdmin)
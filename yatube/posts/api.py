@@ -0,0 +1,113 @@
+"""JSON-версии лент для мобильных клиентов.
+
+Каждый ответ несёт ETag (см. conditional.py). Если клиент прислал его
+обратно и ничего не изменилось, condition() отвечает 304: для этого
+нужен один поход в кэш, а сами посты не читаются.
+"""
+from django.conf import settings
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import condition
+
+from yatube.settings import PAGE_SIZE
+
+from . import timeline
+from .caching import FEED_VERSION_KEY, group_version_key, post_version_key
+from .conditional import first_row, make_etag, viewer_keys
+from .models import Group, Post, User
+from .paginator import CursorPaginator, get_comments_page
+
+
+def serialize_post(post):
+    return {
+        'id': post.pk,
+        'text': post.text,
+        'author': post.author.username,
+        'group': post.group.slug if post.group_id else None,
+        'pub_date': post.pub_date.isoformat(),
+        'image': post.image.url if post.image else None,
+        'comments': post.comment_count,
+    }
+
+
+def serialize_comment(comment):
+    return {
+        'id': comment.pk,
+        'author': comment.author.username,
+        'text': comment.text,
+        'created': comment.created.isoformat(),
+    }
+
+
+def feed_response(request, post_list, key_sources=None):
+    paginator = CursorPaginator(post_list, PAGE_SIZE, key_sources)
+    page = paginator.get_cursor_page(request.GET.get('cursor'))
+    return JsonResponse({
+        'results': [serialize_post(post) for post in page],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+
+def forbidden():
+    return JsonResponse({'error': 'authentication required'}, status=403)
+
+
+def feed_etag(request, **kwargs):
+    return make_etag(request, [FEED_VERSION_KEY])
+
+
+def follow_etag(request):
+    if request.user.is_anonymous:
+        return None
+    return make_etag(request, [FEED_VERSION_KEY, *viewer_keys(request)])
+
+
+def post_etag(request, username, post_id):
+    # В ответе есть slug группы, поэтому важна и её версия
+    row = first_row(
+        Post.objects.filter(pk=post_id, author__username=username),
+        'group_id')
+    if row is None:
+        return None
+    return make_etag(
+        request, [post_version_key(post_id), group_version_key(row[0])])
+
+
+@condition(etag_func=feed_etag)
+def index(request):
+    return feed_response(request, Post.objects.for_feed())
+
+
+@condition(etag_func=feed_etag)
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return feed_response(request, group.posts.for_feed())
+
+
+@condition(etag_func=feed_etag)
+def profile(request, username):
+    author = get_object_or_404(User, username=username)
+    return feed_response(request, author.posts.for_feed())
+
+
+@condition(etag_func=post_etag)
+def post_view(request, username, post_id):
+    post = get_object_or_404(
+        Post.objects.for_feed(), author__username=username, pk=post_id)
+    comments, comments_cursor = get_comments_page(
+        post.comments.select_related('author'), request.GET.get('cursor'),
+        settings.COMMENTS_PAGE_SIZE)
+    data = serialize_post(post)
+    data['comment_list'] = [
+        serialize_comment(comment) for comment in comments]
+    data['next'] = comments_cursor
+    return JsonResponse(data)
+
+
+@condition(etag_func=follow_etag)
+def follow_index(request):
+    if request.user.is_anonymous:
+        return forbidden()
+    return feed_response(request, Post.objects.for_feed(),
+                         timeline.key_sources(request.user))
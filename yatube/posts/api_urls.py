@@ -0,0 +1,13 @@
+from django.urls import path
+
+from . import api
+
+app_name = 'api'
+
+urlpatterns = [
+    path('posts/', api.index, name='index'),
+    path('group/<slug:slug>/', api.group_posts, name='group_posts'),
+    path('follow/', api.follow_index, name='follow_index'),
+    path('<str:username>/', api.profile, name='profile'),
+    path('<str:username>/<int:post_id>/', api.post_view, name='post'),
+]
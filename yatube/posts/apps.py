@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        # Задачи регистрируются при импорте; воркеру run_tasks они нужны,
+        # даже если ни один шаблон ещё не загрузил thumbnails
+        from . import signals, thumbnails  # noqa: F401
@@ -0,0 +1,371 @@
+"""Нагрузочные замеры лент на реалистичных объёмах данных.
+
+seed() заливает в БД воспроизводимый набор пользователей, групп,
+постов, подписок и комментариев пачками bulk_create, а затем
+достраивает то, что обычно поддерживают сигналы: счётчики, ленты
+подписок и поисковый индекс. measure() прогоняет запросы к лентам
+через тестовый клиент и считает перцентили времени и число запросов.
+measure_writers() публикует посты и комментарии из нескольких потоков
+сразу и считает пропускную способность записи.
+
+Команды: bench_seed, bench_feeds и bench_writers.
+"""
+import math
+import random
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import search
+from .bulk import insert_fields, insert_posts
+from .models import (Comment, Follow, Group, Post, TimelineEntry, User,
+                     UserStats)
+
+VOLUMES = {
+    'users': 10000,
+    'groups': 100,
+    'posts': 100000,
+    'follows': 500000,
+    'comments': 300000,
+}
+VIEWS = ('index', 'group_posts', 'profile', 'post_view', 'follow_index')
+WRITE_VIEWS = ('new_post', 'add_comment')
+WORDS = (
+    'лента пост автор группа подписка комментарий картинка новости '
+    'утро вечер город море книга кино музыка работа дом друг'
+).split()
+
+
+def skewed(rng, items):
+    """Случайный элемент с перекосом к началу списка: немногие авторы
+    пишут и собирают подписчиков больше остальных."""
+    return items[int(len(items) * rng.random() ** 3)]
+
+
+def batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def bulk_insert(model, rows, batch_size, log, insert=None):
+    if insert is None:
+        def insert(batch):
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+    total = 0
+    started = time.monotonic()
+    for batch in batched(rows, batch_size):
+        with transaction.atomic():
+            insert(batch)
+        total += len(batch)
+        log(f'{model.__name__}: {total} '
+            f'({total / (time.monotonic() - started):.0f} строк/с)')
+    return total
+
+
+def sentence(rng, words=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, words)))
+
+
+def seed(volumes, seed=0, batch_size=5000, log=print):
+    """Залить данные объёмом volumes; генератор детерминирован seed."""
+    rng = random.Random(seed)
+    now = timezone.now()
+    year = timedelta(days=365).total_seconds()
+
+    def users():
+        for number in range(volumes['users']):
+            user = User(username=f'bench{seed}_{number}')
+            user.set_unusable_password()
+            yield user
+
+    bulk_insert(User, users(), batch_size, log)
+    user_ids = list(User.objects.filter(
+        username__startswith=f'bench{seed}_').values_list('pk', flat=True))
+    bulk_insert(Group, (
+        Group(title=f'Группа {number}', slug=f'bench{seed}-{number}',
+              description=sentence(rng))
+        for number in range(volumes['groups'])), batch_size, log)
+    group_ids = list(Group.objects.filter(
+        slug__startswith=f'bench{seed}-').values_list('pk', flat=True))
+    # Примерно каждый десятый пост без группы
+    group_choices = group_ids + [None] * (len(group_ids) // 9 + 1)
+
+    # Вставка в обход auto_now_add, иначе пропал бы разброс дат публикации
+    fields = insert_fields()
+    bulk_insert(Post, (
+        Post(text=sentence(rng, 60), author_id=skewed(rng, user_ids),
+             group_id=rng.choice(group_choices),
+             pub_date=now - timedelta(seconds=rng.random() * year),
+             image='')
+        for _ in range(volumes['posts'])), batch_size, log,
+        insert=lambda batch: insert_posts(batch, fields, batch_size))
+    post_ids = list(Post.objects.filter(
+        author_id__in=user_ids).values_list('pk', flat=True))
+
+    def follows():
+        for _ in range(volumes['follows']):
+            user_id = rng.choice(user_ids)
+            author_id = skewed(rng, user_ids)
+            if user_id != author_id:
+                yield Follow(user_id=user_id, author_id=author_id)
+
+    bulk_insert(Follow, follows(), batch_size, log)
+    if post_ids:
+        bulk_insert(Comment, (
+            Comment(post_id=skewed(rng, post_ids),
+                    author_id=rng.choice(user_ids), text=sentence(rng))
+            for _ in range(volumes['comments'])), batch_size, log)
+    rebuild_derived(batch_size, log)
+
+
+def rebuild_derived(batch_size=5000, log=print):
+    """Пересчитать то, что bulk_create обходит вместе с сигналами."""
+    counts = {}
+    for field, queryset, key in (
+            ('posts_count', Post.objects, 'author'),
+            ('comments_count', Comment.objects, 'author'),
+            ('followers_count', Follow.objects, 'author'),
+            ('following_count', Follow.objects, 'user')):
+        rows = queryset.order_by().values(key).annotate(n=Count('pk'))
+        for row in rows.iterator():
+            counts.setdefault(row[key], {})[field] = row['n']
+    with transaction.atomic():
+        UserStats.objects.all().delete()
+        bulk_insert(UserStats, (
+            UserStats(user_id=user_id, **counts.get(user_id, {}))
+            for user_id in User.objects.values_list(
+                'pk', flat=True).iterator()), batch_size, log)
+
+    # Ленты подписок: то же, что сделал бы fan-out при публикации
+    timeline = TimelineEntry._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {timeline}')
+        cursor.execute(
+            f'INSERT INTO {timeline} (user_id, post_id, pub_date) '
+            f'SELECT f.user_id, p.id, p.pub_date '
+            f'FROM {Follow._meta.db_table} f '
+            f'JOIN {Post._meta.db_table} p ON p.author_id = f.author_id '
+            f'JOIN {UserStats._meta.db_table} s ON s.user_id = f.author_id '
+            f'WHERE s.followers_count <= %s',
+            [settings.TIMELINE_FANOUT_LIMIT])
+    log(f'TimelineEntry: {TimelineEntry.objects.count()}')
+    log(f'Поиск: {search.rebuild(batch_size=batch_size)}')
+    # Свежая статистика планировщика, иначе планы на новых таблицах
+    # не похожи на боевые
+    if connection.vendor in ('sqlite', 'postgresql'):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+    cache.clear()
+
+
+def percentile(values, fraction):
+    """Перцентиль по ближайшему рангу."""
+    values = sorted(values)
+    if not values:
+        return None
+    rank = max(math.ceil(fraction * len(values)), 1)
+    return values[rank - 1]
+
+
+def targets(rng, view, requests):
+    """Адреса и пользователи для запросов к ленте view."""
+    if view == 'index':
+        return [(reverse('index'), None)] * requests
+    if view == 'group_posts':
+        slugs = list(Group.objects.values_list('slug', flat=True)[:1000])
+        return [(reverse('group_posts', args=[rng.choice(slugs)]), None)
+                for _ in range(requests)] if slugs else []
+    if view == 'profile':
+        authors = list(UserStats.objects.filter(posts_count__gt=0).order_by(
+            '-posts_count').values_list('user__username', flat=True)[:1000])
+        return [(reverse('profile', args=[rng.choice(authors)]), None)
+                for _ in range(requests)] if authors else []
+    if view == 'post_view':
+        posts = list(Post.objects.order_by('-pk').values_list(
+            'author__username', 'pk')[:1000])
+        return [(reverse('post', args=rng.choice(posts)), None)
+                for _ in range(requests)] if posts else []
+    readers = list(UserStats.objects.filter(following_count__gt=0).order_by(
+        '-following_count').values_list('user_id', flat=True)[:1000])
+    users = User.objects.in_bulk(readers)
+    return [(reverse('follow_index'), users[rng.choice(readers)])
+            for _ in range(requests)] if readers else []
+
+
+def measure(views=VIEWS, requests=100, warmup=5, cold=True, seed=0,
+            log=print):
+    """Прогнать запросы к лентам; вернуть сводку по каждой."""
+    rng = random.Random(seed)
+    results = {}
+    for view in views:
+        # Адрес не из INTERNAL_IPS, чтобы не замерять debug_toolbar
+        client = Client(REMOTE_ADDR='192.0.2.1')
+        timings, queries = [], []
+        current_user = None
+        plan = targets(rng, view, requests + warmup)
+        for number, (url, user) in enumerate(plan):
+            if user is not None and user != current_user:
+                client.force_login(user)
+                current_user = user
+            if cold:
+                cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = client.get(url)
+                elapsed = time.perf_counter() - started
+            if response.status_code != 200:
+                raise RuntimeError(f'{url}: {response.status_code}')
+            if number >= warmup:
+                timings.append(elapsed * 1000)
+                queries.append(len(captured))
+        if not timings:
+            log(f'{view}: нет данных для запросов')
+            continue
+        results[view] = {
+            'requests': len(timings),
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p99_ms': round(percentile(timings, 0.99), 2),
+            'mean_ms': round(sum(timings) / len(timings), 2),
+            'queries_p50': percentile(queries, 0.5),
+            'queries_max': max(queries),
+        }
+        log(f'{view}: p50 {results[view]["p50_ms"]} мс, '
+            f'p99 {results[view]["p99_ms"]} мс, '
+            f'запросов {results[view]["queries_p50"]}'
+            f'..{results[view]["queries_max"]}')
+    return results
+
+
+def summary(timings):
+    return {
+        'p50_ms': round(percentile(timings, 0.5), 2),
+        'p99_ms': round(percentile(timings, 0.99), 2),
+    } if timings else {'p50_ms': None, 'p99_ms': None}
+
+
+def writers(count):
+    users = []
+    for number in range(count):
+        user, _ = User.objects.get_or_create(username=f'benchwriter{number}')
+        users.append(user)
+    return users
+
+
+def write_request(client, view, post):
+    if view == 'new_post':
+        return client.post(reverse('new_post'), {'text': 'Замер записи'})
+    return client.post(
+        reverse('add_comment', args=[post.author.username, post.pk]),
+        {'text': 'Замер записи'})
+
+
+def write_burst(client, view, post, requests, barrier, results):
+    """Поток одного писателя: дождаться остальных и писать подряд."""
+    timings, errors = [], 0
+    barrier.wait()
+    try:
+        for _ in range(requests):
+            started = time.perf_counter()
+            try:
+                response = write_request(client, view, post)
+            except DatabaseError:
+                errors += 1
+                continue
+            if response.status_code == 302:
+                timings.append((time.perf_counter() - started) * 1000)
+            else:
+                errors += 1
+    finally:
+        connection.close()
+    results.append((timings, errors))
+
+
+def measure_writers(views=WRITE_VIEWS, workers=8, requests=50, log=print):
+    """Писать из workers потоков по requests раз в каждый view.
+
+    Потоки, как и воркеры gunicorn, открывают свои соединения с базой
+    и ждут друг друга на её блокировках. Ошибка записи (например,
+    "database is locked") не прерывает замер, а считается отдельно.
+    """
+    users = writers(workers)
+    post = Post.objects.select_related('author').order_by('-pk').first()
+    if post is None:
+        post = Post.objects.create(text='Замер записи', author=users[0])
+    clients = []
+    for user in users:
+        client = Client(REMOTE_ADDR='192.0.2.1')
+        client.force_login(user)
+        clients.append(client)
+    results = {}
+    for view in views:
+        barrier = threading.Barrier(workers + 1)
+        bursts = []
+        threads = [
+            threading.Thread(target=write_burst, args=[
+                client, view, post, requests, barrier, bursts])
+            for client in clients]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        timings = [timing for burst, _ in bursts for timing in burst]
+        results[view] = {
+            'workers': workers,
+            'requests': workers * requests,
+            'errors': sum(errors for _, errors in bursts),
+            'per_second': round(len(timings) / elapsed, 1),
+            **summary(timings),
+        }
+        log(f'{view}: {results[view]["per_second"]} записей/с, '
+            f'p50 {results[view]["p50_ms"]} мс, '
+            f'p99 {results[view]["p99_ms"]} мс, '
+            f'ошибок {results[view]["errors"]}')
+    return results
+
+
+def database_profile():
+    """Чем запись ограничена в текущей базе: движок и его настройки."""
+    settings_dict = connection.settings_dict
+    profile = {
+        'vendor': connection.vendor,
+        'engine': settings_dict['ENGINE'],
+        'conn_max_age': settings_dict['CONN_MAX_AGE'],
+    }
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            for pragma in ('journal_mode', 'synchronous', 'busy_timeout'):
+                cursor.execute(f'PRAGMA {pragma}')
+                profile[pragma] = cursor.fetchone()[0]
+    else:
+        profile['health_checks'] = settings_dict.get(
+            'CONN_HEALTH_CHECKS', False)
+    return profile
+
+
+def volumes_in_db():
+    return {
+        'users': User.objects.count(),
+        'groups': Group.objects.count(),
+        'posts': Post.objects.count(),
+        'follows': Follow.objects.count(),
+        'comments': Comment.objects.count(),
+        'timeline': TimelineEntry.objects.count(),
+    }
@@ -0,0 +1,38 @@
+"""Вставка постов пачками с датами публикации из источника.
+
+Нужна загрузке выгрузок и нагрузочным замерам: bulk_create вызывает
+pre_save полей, и auto_now_add затёр бы переданные даты.
+"""
+import copy
+
+from django.db import connections
+from django.db.models.sql import InsertQuery
+
+from .models import Post
+
+
+def insert_fields():
+    """Поля Post для вставки.
+
+    Само поле модели менять нельзя: его видят сохранения в других
+    потоках, поэтому вставляем через копию без auto_now_add.
+    """
+    fields = []
+    for field in Post._meta.concrete_fields:
+        if field.primary_key:
+            continue
+        if field.name == 'pub_date':
+            field = copy.copy(field)
+            field.auto_now_add = False
+        fields.append(field)
+    return fields
+
+
+def insert_posts(posts, fields, batch_size):
+    connection = connections[Post.objects.db]
+    size = max(min(batch_size,
+                   connection.ops.bulk_batch_size(fields, posts)), 1)
+    for start in range(0, len(posts), size):
+        query = InsertQuery(Post)
+        query.insert_values(fields, posts[start:start + size])
+        query.get_compiler(connection=connection).execute_sql()
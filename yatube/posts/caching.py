@@ -0,0 +1,119 @@
+"""Версии закэшированных фрагментов и кэш ленты на главной.
+
+Вместо удаления фрагментов из кэша меняется версия, входящая в их ключ.
+Версия - случайная метка, а не счётчик: если она вытеснится из кэша,
+новая метка не совпадёт ни с одним старым ключом.
+"""
+import time
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from yatube import db_router
+
+from .paginator import decode_cursor, encode_cursor
+
+VERSION_TIMEOUT = None
+
+
+def post_version_key(post_id):
+    return f'post_version:{post_id}'
+
+
+def group_version_key(group_id):
+    return f'group_version:{group_id}'
+
+
+def user_feed_version_key(user_id):
+    """Версия ленты подписок: меняется при подписке и отписке."""
+    return f'user_feed_version:{user_id}'
+
+
+def get_versions(keys):
+    versions = cache.get_many(keys + db_router.recent_write_keys())
+    if versions.pop(db_router.RECENT_WRITE_KEY, None):
+        db_router.use_primary()
+    for key in keys:
+        if key not in versions:
+            cache.add(key, uuid4().hex, VERSION_TIMEOUT)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_version(key):
+    """Сменить версию после коммита текущей транзакции.
+
+    Иначе параллельный запрос успел бы взять новую версию, прочитать ещё
+    старые строки и закэшировать их под новым ключом. По той же причине
+    чтение на время, пока реплики догоняют, уходит в основную базу.
+    """
+    def bump():
+        db_router.note_write()
+        cache.set(key, uuid4().hex, VERSION_TIMEOUT)
+
+    transaction.on_commit(bump)
+
+
+def post_card_version(post):
+    """Версия карточки поста: меняется при правке поста, его группы
+    и при изменении комментариев к нему."""
+    return '.'.join(get_versions([
+        post_version_key(post.pk), group_version_key(post.group_id)]))
+
+
+FEED_VERSION_KEY = 'feed_version'
+
+
+def feed_body_key(request):
+    """Ключ тела ленты на главной или None, если его не кэшируем.
+
+    Возвращает пару (ключ в кэше, версия ленты). Ключ строится только
+    из проверенного курсора, закодированного заново, поэтому мусор
+    в параметрах не плодит записи в кэше. Запросы с другими
+    параметрами, в том числе ?page=N старых ссылок, рисуются без кэша.
+    Версия берётся до отрисовки: тело, нарисованное во время смены
+    версии, сохранится под старой и будет перерисовано.
+    """
+    if set(request.GET) - {'cursor'}:
+        return None
+    cursor = request.GET.get('cursor')
+    decoded = decode_cursor(cursor) if cursor else None
+    position = encode_cursor(*decoded) if decoded else 'first'
+    version, = get_versions([FEED_VERSION_KEY])
+    return f'feed_body:{position}', version
+
+
+def get_feed_body(key):
+    """Закэшированное тело ленты и признак, что оно текущей версии.
+
+    Свежая запись текущей версии отдаётся как есть. Просроченная (stale)
+    запись или запись старой версии ленты, например до нового поста,
+    тоже отдаётся, пока её перерисовывает один запрос, захвативший
+    блокировку; этому запросу, как и при пустом кэше, возвращается
+    (None, True).
+    """
+    cache_key, version = key
+    entry = cache.get(cache_key)
+    if entry is None:
+        return None, True
+    current = entry['version'] == version
+    if current and entry['fresh_until'] > time.time():
+        return entry['body'], True
+    if cache.add(cache_key + ':lock', True,
+                 settings.FEED_CACHE_LOCK_TIMEOUT):
+        return None, True
+    return entry['body'], current
+
+
+def set_feed_body(key, body):
+    cache_key, version = key
+    entry = {
+        'body': body,
+        'version': version,
+        'fresh_until': time.time() + settings.FEED_CACHE_TIMEOUT,
+    }
+    cache.set(cache_key, entry,
+              settings.FEED_CACHE_TIMEOUT + settings.FEED_CACHE_STALE_TIMEOUT)
+    cache.delete(cache_key + ':lock')
@@ -0,0 +1,72 @@
+"""Потоковая выгрузка постов, комментариев и подписок.
+
+Строки читаются из БД кусками через iterator(chunk_size) и сразу
+превращаются в текст, поэтому память не растёт вместе с таблицей.
+Формат постов совпадает с тем, что принимает import_posts.
+"""
+import csv
+import json
+
+from django.conf import settings
+
+from .models import Comment, Follow, Post
+
+# Для каждого вида данных - queryset и пары (колонка, поле модели)
+KINDS = {
+    'posts': (Post.objects.order_by('pk'), (
+        ('id', 'pk'),
+        ('text', 'text'),
+        ('author', 'author__username'),
+        ('group', 'group__slug'),
+        ('pub_date', 'pub_date'),
+        ('image', 'image'),
+    )),
+    'comments': (Comment.objects.order_by('pk'), (
+        ('id', 'pk'),
+        ('post', 'post_id'),
+        ('author', 'author__username'),
+        ('text', 'text'),
+        ('created', 'created'),
+    )),
+    'follows': (Follow.objects.order_by('pk'), (
+        ('user', 'user__username'),
+        ('author', 'author__username'),
+    )),
+}
+FORMATS = ('jsonl', 'csv')
+
+
+class Echo:
+    """Файл для csv.writer, который возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def prepare(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def rows(kind, chunk_size=None):
+    queryset, columns = KINDS[kind]
+    fields = [field for _, field in columns]
+    for values in queryset.values_list(*fields).iterator(
+            chunk_size=chunk_size or settings.EXPORT_CHUNK_SIZE):
+        yield [prepare(value) for value in values]
+
+
+def lines(kind, fmt='jsonl', chunk_size=None):
+    """Строки выгрузки вместе с переводами строк."""
+    names = [name for name, _ in KINDS[kind][1]]
+    if fmt == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(names)
+        for row in rows(kind, chunk_size):
+            yield writer.writerow(row)
+        return
+    for row in rows(kind, chunk_size):
+        yield json.dumps(dict(zip(names, row)), ensure_ascii=False) + '\n'
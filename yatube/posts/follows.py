@@ -0,0 +1,42 @@
+"""Подписки на авторов без гонок между параллельными запросами.
+
+Вставка идёт через INSERT ... ON CONFLICT DO NOTHING (bulk_create
+с ignore_conflicts), удаление - через QuerySet.delete(), поэтому
+повторный клик или параллельный запрос не приводит к ошибке.
+bulk_create не шлёт сигналы, и задачи, которые иначе поставил бы
+post_save, ставятся здесь; при удалении их ставят сигналы. Счётчики
+в задаче пересчитываются, а не сдвигаются, так что гонки их не портят.
+"""
+from django.db import transaction
+
+from . import jobs
+from .caching import bump_version, user_feed_version_key
+from .models import Follow
+
+
+def follow(user, author_ids):
+    """Подписать user на авторов; вернуть их id.
+
+    Подписки, которые уже были, не отличаются от новых: узнать это
+    можно только отдельным SELECT до вставки.
+    """
+    author_ids = sorted(set(author_ids) - {user.pk})
+    if not author_ids:
+        return []
+    with transaction.atomic():
+        Follow.objects.bulk_create(
+            [Follow(user=user, author_id=pk) for pk in author_ids],
+            ignore_conflicts=True)
+        jobs.refresh_follow_stats.delay(user.pk, *author_ids)
+        for author_id in author_ids:
+            jobs.backfill.delay(user.pk, author_id)
+    bump_version(user_feed_version_key(user.pk))
+    return author_ids
+
+
+def unfollow(user, author_ids):
+    """Отписать user от авторов; вернуть число удалённых подписок."""
+    with transaction.atomic():
+        deleted, _ = Follow.objects.filter(
+            user=user, author_id__in=list(author_ids)).delete()
+    return deleted
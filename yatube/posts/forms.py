@@ -1,5 +1,7 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 
+from . import images
 from .models import Comment, Post
 
 
@@ -8,6 +10,21 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        post = self.instance
+        if isinstance(image, UploadedFile):
+            try:
+                image, width, height = images.process(image)
+            except images.ImageError:
+                raise forms.ValidationError(
+                    'Не удалось обработать изображение')
+            post.image_width, post.image_height = width, height
+            post.image_size = image.size
+        elif not image:
+            post.image_width = post.image_height = post.image_size = None
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,158 @@
+"""Обработка загруженных картинок постов.
+
+Картинка уменьшается до IMAGE_MAX_SIZE, поворачивается по EXIF
+и пересохраняется в IMAGE_FORMAT (прогрессивный JPEG или WebP)
+с качеством IMAGE_QUALITY. Метаданные камеры, включая координаты,
+при этом не переносятся; остаётся только цветовой профиль RGB.
+CMYK переводится в sRGB через свой профиль.
+
+Декодирование и кодирование занимают процессор на сотни миллисекунд,
+поэтому идут в пуле из IMAGE_WORKERS процессов: поток запроса в это
+время ждёт, не удерживая GIL, и остальные потоки воркера работают.
+encode() не обращается к Django, чтобы процессам пула не нужно было
+поднимать проект.
+"""
+import io
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageCms, ImageOps
+
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp'}
+# Режимы, профиль которых подходит и для результата в RGB
+RGB_MODES = ('RGB', 'RGBA', 'P')
+
+_pool = None
+# Пул создают и сбрасывают потоки запросов
+_pool_lock = threading.Lock()
+
+
+class ImageError(Exception):
+    pass
+
+
+# Чем Pillow отвечает на битые и слишком большие картинки
+ERRORS = (OSError, ValueError, SyntaxError, Image.DecompressionBombError,
+          ImageError)
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS,
+                mp_context=get_context('spawn'))
+        return _pool
+
+
+def reset_pool(pool):
+    """Забыть сломанный пул, если другой поток его ещё не заменил."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+
+
+def has_alpha(image):
+    return image.mode in ('RGBA', 'LA') or (
+        image.mode == 'P' and 'transparency' in image.info)
+
+
+def to_srgb(image, icc_profile):
+    """CMYK с профилем -> RGB через этот профиль, или None."""
+    try:
+        return ImageCms.profileToProfile(
+            image, ImageCms.ImageCmsProfile(io.BytesIO(icc_profile)),
+            ImageCms.createProfile('sRGB'), outputMode='RGB')
+    except (ImageCms.PyCMSError, OSError):
+        return None
+
+
+def encode(data, max_size, image_format, quality):
+    """Байты картинки -> (байты после обработки, ширина, высота)."""
+    with Image.open(io.BytesIO(data)) as source:
+        # JPEG сразу декодируется в уменьшенном в 2-8 раз виде
+        side = max(max_size)
+        source.draft('RGB', (side, side))
+        icc_profile = source.info.get('icc_profile')
+        image = ImageOps.exif_transpose(source)
+        if image.mode == 'CMYK' and icc_profile:
+            image = to_srgb(image, icc_profile) or image
+        if image.mode not in RGB_MODES:
+            # Профиль CMYK или оттенков серого к RGB не подходит
+            icc_profile = None
+        # Переводим в RGB до уменьшения: для палитры LANCZOS молча
+        # заменяется на NEAREST
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if has_alpha(image) else 'RGB')
+        image.thumbnail(max_size, Image.LANCZOS)
+        if image_format == 'JPEG' and image.mode == 'RGBA':
+            # В JPEG нет прозрачности: кладём картинку на белый фон
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        options = {'quality': quality}
+        if image_format == 'JPEG':
+            options.update(progressive=True, optimize=True)
+        else:
+            options.update(method=4)
+        if icc_profile:
+            options['icc_profile'] = icc_profile
+        output = io.BytesIO()
+        image.save(output, image_format, **options)
+    return output.getvalue(), image.width, image.height
+
+
+def submit(data):
+    """Поставить обработку в пул; вернуть Future с результатом encode()."""
+    args = (data, settings.IMAGE_MAX_SIZE, settings.IMAGE_FORMAT,
+            settings.IMAGE_QUALITY)
+    if settings.IMAGE_WORKERS:
+        pool = get_pool()
+        try:
+            future = pool.submit(encode, *args)
+        except BrokenProcessPool:
+            reset_pool(pool)
+            future = Future()
+            future.set_exception(
+                ImageError('Пул обработки картинок перезапущен'))
+        future.pool = pool
+        return future
+    future = Future()
+    try:
+        future.set_result(encode(*args))
+    except Exception as error:
+        future.set_exception(error)
+    return future
+
+
+def result(future):
+    try:
+        return future.result()
+    except BrokenProcessPool:
+        # Процесс пула убит (например, по памяти): следующая картинка
+        # получит новый пул
+        reset_pool(future.pool)
+        raise ImageError('Пул обработки картинок перезапущен')
+
+
+def processed_name(name):
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return f'{stem}.{EXTENSIONS[settings.IMAGE_FORMAT]}'
+
+
+def process(file):
+    """Обработанная копия загруженного файла: (ContentFile, ширина,
+    высота). Имя сохраняется, меняется только расширение."""
+    file.seek(0)
+    try:
+        content, width, height = result(submit(file.read()))
+    except ERRORS as error:
+        raise ImageError(str(error)) from error
+    return ContentFile(content, name=processed_name(file.name)), width, height
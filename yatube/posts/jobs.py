@@ -0,0 +1,73 @@
+"""Задачи, которые сигналы ставят в очередь после сохранения моделей.
+
+Каждая задача получает id и сама читает то, что ей нужно: к моменту
+выполнения строку могли изменить или удалить. После раскладки по лентам
+версии кэша сдвигаются ещё раз, иначе ETag, посчитанный до окончания
+задачи, закрепил бы неполную ленту.
+"""
+from django.db import transaction
+
+from . import search, thumbnails, timeline
+from .caching import FEED_VERSION_KEY, bump_version, user_feed_version_key
+from .models import Blob, Follow, Post, UserStats
+from .storage import blob_storage
+from .tasks import task
+
+
+@task
+def bump_stats(user_id, **deltas):
+    UserStats.objects.bump(user_id, **deltas)
+
+
+@task
+def refresh_follow_stats(user_id, *author_ids):
+    timeline.refresh_follows([user_id], author_ids)
+
+
+@task
+def fan_out(post_id):
+    post = Post.objects.select_related('author').filter(pk=post_id).first()
+    if post is None:
+        return
+    timeline.fan_out(post)
+    bump_version(FEED_VERSION_KEY)
+
+
+@task
+def backfill(user_id, author_id):
+    follow = Follow.objects.select_related('user', 'author').filter(
+        user_id=user_id, author_id=author_id).first()
+    if follow is None:
+        return
+    timeline.backfill(follow.user, follow.author)
+    bump_version(user_feed_version_key(user_id))
+
+
+@task
+def index_post(post_id):
+    text = Post.objects.filter(pk=post_id).values_list(
+        'text', flat=True).first()
+    if text is not None:
+        search.index_posts([(post_id, text)])
+
+
+@task
+def unindex_post(post_id):
+    search.remove_post(post_id)
+
+
+@task
+def delete_blob(name):
+    """Удалить файл, на который не осталось ссылок, вместе с миниатюрами.
+
+    Строка Blob блокируется: параллельная загрузка того же файла ждёт
+    коммита и, не найдя файла, запишет его заново.
+    """
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(
+            name=name, refs__lte=0).first()
+        if blob is None:
+            return
+        blob.delete()
+        thumbnails.delete(name)
+        blob_storage.delete(name)
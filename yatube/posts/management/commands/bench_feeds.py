@@ -0,0 +1,71 @@
+import json
+import subprocess
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from posts import benchmark
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Замеряет p50/p99 и число SQL-запросов для лент и сохраняет '
+            'результат в JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--views', nargs='+', default=benchmark.VIEWS,
+                            choices=benchmark.VIEWS)
+        parser.add_argument('--requests', type=int, default=100)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--warm-cache', action='store_true',
+                            help='Не сбрасывать кэш перед запросами')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Файл для результатов')
+        parser.add_argument('--compare',
+                            help='JSON прошлого прогона для сравнения')
+
+    def handle(self, *args, **options):
+        results = benchmark.measure(
+            views=options['views'], requests=options['requests'],
+            warmup=options['warmup'], cold=not options['warm_cache'],
+            seed=options['seed'], log=self.stdout.write)
+        report = {
+            'commit': git_commit(),
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'cache': 'warm' if options['warm_cache'] else 'cold',
+            'volumes': benchmark.volumes_in_db(),
+            'views': results,
+        }
+        output = options['output'] or (
+            f'bench-{report["commit"] or "local"}-'
+            f'{datetime.now():%Y%m%d%H%M%S}.json')
+        with open(output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Результаты: {output}'))
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def compare(self, path, results):
+        with open(path, encoding='utf-8') as file:
+            previous = json.load(file)
+        self.stdout.write(f'Сравнение с {previous.get("commit")}:')
+        for view, current in results.items():
+            before = previous['views'].get(view)
+            if before is None:
+                continue
+            self.stdout.write(
+                f'{view}: p50 {before["p50_ms"]} -> {current["p50_ms"]} мс, '
+                f'p99 {before["p99_ms"]} -> {current["p99_ms"]} мс, '
+                f'запросов {before["queries_max"]} -> '
+                f'{current["queries_max"]}')
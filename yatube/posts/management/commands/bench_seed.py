@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from posts import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Заливает воспроизводимый набор данных для bench_feeds. '
+            'Запускайте на отдельной БД: данные не удаляются')
+
+    def add_arguments(self, parser):
+        for name, default in benchmark.VOLUMES.items():
+            parser.add_argument(f'--{name}', type=int, default=default)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        volumes = {name: options[name] for name in benchmark.VOLUMES}
+        benchmark.seed(volumes, seed=options['seed'],
+                       batch_size=options['batch_size'],
+                       log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(
+            f'В базе: {benchmark.volumes_in_db()}'))
@@ -0,0 +1,42 @@
+import json
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from posts import benchmark
+
+from .bench_feeds import git_commit
+
+
+class Command(BaseCommand):
+    help = ('Замеряет пропускную способность new_post и add_comment '
+            'при нескольких одновременных писателях')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--views', nargs='+',
+                            default=benchmark.WRITE_VIEWS,
+                            choices=benchmark.WRITE_VIEWS)
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Запросов на каждого писателя')
+        parser.add_argument('--output', help='Файл для результатов')
+
+    def handle(self, *args, **options):
+        profile = benchmark.database_profile()
+        self.stdout.write(', '.join(
+            f'{key}={value}' for key, value in profile.items()))
+        results = benchmark.measure_writers(
+            views=options['views'], workers=options['workers'],
+            requests=options['requests'], log=self.stdout.write)
+        if not options['output']:
+            return
+        report = {
+            'commit': git_commit(),
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'database': profile,
+            'views': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(
+            f'Результаты: {options["output"]}'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from posts.export import FORMATS, KINDS, lines
+
+
+class Command(BaseCommand):
+    help = 'Потоково выгружает посты, комментарии или подписки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', nargs='?', default='posts',
+                            choices=tuple(KINDS))
+        parser.add_argument('--format', default='jsonl', choices=FORMATS)
+        parser.add_argument('--output', default='-',
+                            help='Файл или "-" для stdout')
+        parser.add_argument('--chunk-size', type=int)
+
+    def handle(self, *args, **options):
+        export = lines(
+            options['kind'], options['format'], options['chunk_size'])
+        if options['output'] == '-':
+            for line in export:
+                self.stdout.write(line, ending='')
+            return
+        with open(options['output'], 'w', newline='',
+                  encoding='utf-8') as stream:
+            stream.writelines(export)
@@ -0,0 +1,169 @@
+import csv
+import json
+import sys
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts import search, timeline
+from posts.bulk import insert_fields, insert_posts
+from posts.caching import FEED_VERSION_KEY, bump_version
+from posts.models import Blob, Group, Post, User, UserStats
+
+
+def is_safe_image_name(name):
+    """Путь картинки из выгрузки не выходит за MEDIA_ROOT."""
+    parts = name.replace('\\', '/').split('/')
+    return not (name.startswith(('/', '\\')) or '..' in parts
+                or ':' in parts[0])
+
+
+def read_rows(stream, fmt):
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        # Битая строка пропускается, как строка без обязательных полей
+        yield row if isinstance(row, dict) else {}
+
+
+class Command(BaseCommand):
+    help = ('Загружает посты из JSONL или CSV с полями text, author '
+            '(username), group (slug), pub_date и image')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл или "-" для stdin')
+        parser.add_argument('--format', choices=('jsonl', 'csv'),
+                            help='По умолчанию определяется по расширению')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--create-authors', action='store_true',
+                            help='Создавать неизвестных авторов')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or (
+            'csv' if path.endswith('.csv') else 'jsonl')
+        self.batch_size = options['batch_size']
+        if self.batch_size < 1:
+            raise CommandError('--batch-size должен быть положительным')
+        self.create_authors = options['create_authors']
+        self.authors = {}
+        self.groups = {}
+        self.touched_authors = set()
+        self.skipped = 0
+        self.fields = insert_fields()
+
+        stream = sys.stdin if path == '-' else open(
+            path, newline='', encoding='utf-8')
+        last_pk = Post.objects.order_by('-pk').values_list(
+            'pk', flat=True).first() or 0
+        started = time.monotonic()
+        imported = 0
+        try:
+            rows = read_rows(stream, fmt)
+            while True:
+                batch = list(islice(rows, self.batch_size))
+                if not batch:
+                    break
+                imported += self.import_batch(batch)
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'Загружено {imported}, пропущено {self.skipped}, '
+                    f'{imported / elapsed:.0f} строк/с')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        self.after_import(last_pk)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {imported} постов за {elapsed:.1f} с'))
+
+    def resolve(self, cache, model, field, values, create=None):
+        missing = {value for value in values if value and value not in cache}
+        if not missing:
+            return
+        cache.update(model.objects.filter(
+            **{f'{field}__in': missing}).values_list(field, 'pk'))
+        missing -= cache.keys()
+        if missing and create:
+            create(missing)
+            cache.update(model.objects.filter(
+                **{f'{field}__in': missing}).values_list(field, 'pk'))
+
+    def create_users(self, usernames):
+        users = [User(username=username) for username in usernames]
+        for user in users:
+            user.set_unusable_password()
+        User.objects.bulk_create(users, ignore_conflicts=True)
+
+    def import_batch(self, batch):
+        self.resolve(
+            self.authors, User, 'username',
+            {row.get('author') for row in batch},
+            self.create_users if self.create_authors else None)
+        self.resolve(
+            self.groups, Group, 'slug', {row.get('group') for row in batch})
+        posts = []
+        for row in batch:
+            post = self.build_post(row)
+            if post is None:
+                self.skipped += 1
+                continue
+            posts.append(post)
+            self.touched_authors.add(post.author_id)
+        with transaction.atomic():
+            insert_posts(posts, self.fields, self.batch_size)
+        return len(posts)
+
+    def build_post(self, row):
+        author_id = self.authors.get(row.get('author'))
+        group_slug = row.get('group')
+        group_id = self.groups.get(group_slug)
+        text = row.get('text')
+        if not text or author_id is None:
+            return None
+        if group_slug and group_id is None:
+            return None
+        image = row.get('image') or ''
+        if image and not is_safe_image_name(image):
+            return None
+        pub_date = timezone.now()
+        if row.get('pub_date'):
+            try:
+                pub_date = parse_datetime(row['pub_date'])
+            except (TypeError, ValueError):
+                # Похоже на дату, но такого дня нет: 2020-13-45
+                pub_date = None
+            if pub_date is None:
+                return None
+            if timezone.is_naive(pub_date):
+                pub_date = timezone.make_aware(pub_date)
+        return Post(text=text, author_id=author_id, group_id=group_id,
+                    pub_date=pub_date, image=image)
+
+    def after_import(self, last_pk):
+        # Вставка мимо save() не шлёт сигналы: счётчики авторов пересчитаются
+        # при первом чтении, ленты подписчиков, поиск и ссылки на файлы
+        # картинок дозаполняются здесь
+        imported = Post.objects.filter(pk__gt=last_pk)
+        search.rebuild(imported, batch_size=self.batch_size)
+        images = imported.exclude(image='').order_by().values(
+            'image').annotate(count=Count('pk'))
+        for row in images:
+            Blob.objects.acquire(row['image'], row['count'])
+        UserStats.objects.filter(user_id__in=self.touched_authors).delete()
+        for author in User.objects.filter(pk__in=self.touched_authors):
+            timeline.backfill_followers(author)
+        bump_version(FEED_VERSION_KEY)
@@ -0,0 +1,62 @@
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+
+from posts import images
+from posts.caching import FEED_VERSION_KEY, bump_version, post_version_key
+from posts.models import Blob, Post
+
+
+class Command(BaseCommand):
+    help = ('Пересохраняет картинки постов, загруженные до обработки '
+            'загрузок: уменьшает, перекодирует и удаляет оригиналы')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20)
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').exclude(
+            image__isnull=True).filter(image_size__isnull=True).only('image')
+        done = failed = 0
+        batch = []
+        for post in posts.iterator():
+            batch.append(post)
+            if len(batch) >= options['batch_size']:
+                ok, errors = self.process(batch)
+                done, failed = done + ok, failed + errors
+                batch = []
+        ok, errors = self.process(batch)
+        done, failed = done + ok, failed + errors
+        if done:
+            bump_version(FEED_VERSION_KEY)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано: {done}, с ошибкой: {failed}'))
+
+    def process(self, posts):
+        # Все картинки пачки обрабатываются параллельно в пуле
+        futures = []
+        for post in posts:
+            try:
+                with post.image.open('rb') as file:
+                    futures.append((post, images.submit(file.read())))
+            except OSError as error:
+                self.stderr.write(f'{post.image.name}: {error}')
+        done = 0
+        for post, future in futures:
+            try:
+                content, width, height = images.result(future)
+            except images.ERRORS as error:
+                self.stderr.write(f'{post.image.name}: {error}')
+                continue
+            original = post.image.name
+            post.image.save(
+                images.processed_name(original),
+                ContentFile(content), save=False)
+            Post.objects.filter(pk=post.pk).update(
+                image=post.image.name, image_width=width,
+                image_height=height, image_size=len(content))
+            # Старые загрузки лежат вне хранилища по хэшу и удаляются сразу
+            if not Blob.objects.release(original):
+                post.image.storage.delete(original)
+            bump_version(post_version_key(post.pk))
+            done += 1
+        return done, len(posts) - done
@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import timeline
+from posts.models import User, UserStats
+
+FIELDS = (
+    'posts_count', 'comments_count', 'followers_count', 'following_count')
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики пользователей и исправляет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать расхождения, ничего не записывая')
+
+    def handle(self, *args, **options):
+        repaired = 0
+        for user_id in User.objects.values_list('pk', flat=True).iterator():
+            # Сверка без транзакции: BEGIN IMMEDIATE взял бы блокировку
+            # записи даже для пользователя, у которого всё сходится
+            if self.in_sync(user_id):
+                continue
+            with transaction.atomic():
+                counts = UserStats.objects.counts_for(user_id)
+                stats = UserStats.objects.select_for_update().filter(
+                    user_id=user_id).first()
+                if stats is None:
+                    if not options['dry_run']:
+                        UserStats.objects.create(user_id=user_id, **counts)
+                    repaired += 1
+                    continue
+                if all(getattr(stats, f) == counts[f] for f in FIELDS):
+                    continue
+                repaired += 1
+                self.stdout.write(f'user {user_id}: ' + ', '.join(
+                    f'{f} {getattr(stats, f)} -> {counts[f]}'
+                    for f in FIELDS if getattr(stats, f) != counts[f]))
+                if not options['dry_run']:
+                    UserStats.objects.filter(user_id=user_id).update(**counts)
+                    limit = settings.TIMELINE_FANOUT_LIMIT
+                    if stats.followers_count > limit >= counts[
+                            'followers_count']:
+                        # Записи автора больше не подмешиваются при чтении
+                        timeline.backfill_followers(stats.user)
+        self.stdout.write(
+            self.style.SUCCESS(f'Исправлено записей: {repaired}'))
+
+    def in_sync(self, user_id):
+        stats = UserStats.objects.filter(user_id=user_id).values(
+            *FIELDS).first()
+        return stats == UserStats.objects.counts_for(user_id)
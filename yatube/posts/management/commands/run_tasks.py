@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from posts import tasks
+
+
+class Command(BaseCommand):
+    help = ('Выполняет фоновые задачи из таблицы Task '
+            '(TASKS_BACKEND = "db")')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--sleep', type=float, default=1,
+                            help='Пауза, когда задач нет, секунды')
+        parser.add_argument('--once', action='store_true',
+                            help='Выполнить готовые задачи и выйти')
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                done, failed = tasks.run_pending(options['batch_size'])
+                if done or failed:
+                    self.stdout.write(
+                        f'Выполнено: {done}, с ошибкой: {failed}')
+                elif options['once']:
+                    return
+                else:
+                    # Соединение могло устареть, пока воркер ждал
+                    close_old_connections()
+                    time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,59 @@
+# Generated by Django 2.2.28 on 2026-10-18 01:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_timeline(apps, schema_editor):
+    # Как timeline.backfill: последние посты автора и без знаменитостей,
+    # их посты лента подмешивает при чтении
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    authors = Follow.objects.exclude(author=None).order_by().values(
+        'author_id').annotate(followers=models.Count('pk')).filter(
+        followers__lte=settings.TIMELINE_FANOUT_LIMIT)
+    for author_id in authors.values_list('author_id', flat=True).iterator():
+        posts = list(Post.objects.filter(author_id=author_id).order_by(
+            '-pub_date').values_list('pk', 'pub_date')[
+            :settings.TIMELINE_BACKFILL_SIZE])
+        if not posts:
+            continue
+        followers = Follow.objects.filter(
+            author_id=author_id).values_list('user_id', flat=True)
+        TimelineEntry.objects.bulk_create(
+            (TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+             for user_id in followers.iterator()
+             for pk, pub_date in posts),
+            batch_size=settings.TIMELINE_BATCH_SIZE,
+            ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0013_userstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='posts.Post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-pub_date', '-post'], name='timeline_user_pub_date_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='timelineentry',
+            unique_together={('user', 'post')},
+        ),
+        migrations.RunPython(fill_timeline, migrations.RunPython.noop),
+    ]
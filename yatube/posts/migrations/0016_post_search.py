@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    # Таблица индекса не описывается моделью: её вид зависит от СУБД
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE posts_post_fts "
+            "USING fts5(text, tokenize='unicode61')")
+        schema_editor.execute(
+            'INSERT INTO posts_post_fts (rowid, text) '
+            'SELECT id, text FROM posts_post')
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE TABLE posts_post_search ('
+            'post_id integer PRIMARY KEY '
+            'REFERENCES posts_post (id) ON DELETE CASCADE, '
+            'document tsvector NOT NULL)')
+        schema_editor.execute(
+            'CREATE INDEX posts_post_search_document_idx '
+            'ON posts_post_search USING GIN (document)')
+        schema_editor.execute(
+            'INSERT INTO posts_post_search (post_id, document) '
+            'SELECT id, to_tsvector(%s::regconfig, text) FROM posts_post',
+            [settings.SEARCH_CONFIG])
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS posts_post_fts')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP TABLE IF EXISTS posts_post_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -1,5 +1,9 @@
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .storage import blob_storage, is_blob
 
 User = get_user_model()
 
@@ -13,6 +17,17 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Записи со всем, что нужно для карточки поста, за один запрос."""
+        comment_count = Comment.objects.filter(
+            post=OuterRef('pk')
+        ).order_by().values('post').annotate(count=Count('pk')).values('count')
+        return self.select_related('author', 'group').annotate(
+            comment_count=Coalesce(
+                Subquery(comment_count, output_field=IntegerField()), 0))
+
+
 class Post(models.Model):
     text = models.TextField(verbose_name='текст')
     pub_date = models.DateTimeField("date published", auto_now_add=True)
@@ -28,15 +43,39 @@ class Post(models.Model):
         verbose_name='группа')
     image = models.ImageField(
         upload_to='posts/',
+        storage=blob_storage,
         blank=True, null=True,
         verbose_name='изображение')
+    # Заполняет обработка загрузки (см. images.py). Не width_field и
+    # height_field: те открывают файл при каждой загрузке поста из БД
+    image_width = models.PositiveIntegerField(
+        null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(
+        null=True, blank=True, editable=False)
+    image_size = models.PositiveIntegerField(
+        null=True, blank=True, editable=False)
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='post_pub_date_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_pub_date_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_pub_date_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
+    @property
+    def card_version(self):
+        from .caching import post_card_version
+        return post_card_version(self)
+
 
 class Comment(models.Model):
     post = models.ForeignKey(Post,
@@ -48,6 +87,12 @@ class Comment(models.Model):
     text = models.TextField()
     created = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created'],
+                         name='comment_post_created_idx'),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(User,
@@ -60,3 +105,157 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ['user', 'author']
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user_idx'),
+        ]
+
+
+class UserStatsManager(models.Manager):
+    def counts_for(self, user_id):
+        return {
+            'posts_count': Post.objects.filter(author_id=user_id).count(),
+            'comments_count': Comment.objects.filter(
+                author_id=user_id).count(),
+            'followers_count': Follow.objects.filter(
+                author_id=user_id).count(),
+            'following_count': Follow.objects.filter(
+                user_id=user_id).count(),
+        }
+
+    def for_user(self, user):
+        """Счётчики пользователя; при первом обращении они пересчитываются."""
+        try:
+            return self.get(user=user)
+        except self.model.DoesNotExist:
+            stats, _ = self.get_or_create(
+                user=user, defaults=self.counts_for(user.pk))
+            return stats
+
+    def refresh_follows(self, user_ids=(), author_ids=()):
+        """Пересчитать счётчики подписок из таблицы Follow.
+
+        Пересчёт идемпотентен, поэтому повторная подписка или отписка
+        в параллельном запросе не сдвигает счётчики дважды. Каждая
+        группа пользователей обновляется одним UPDATE по индексам Follow.
+        """
+        for ids, field, column in (
+                (user_ids, 'following_count', 'user'),
+                (author_ids, 'followers_count', 'author')):
+            ids = [pk for pk in ids if pk is not None]
+            if not ids:
+                continue
+            count = Follow.objects.filter(
+                **{column: OuterRef('user')}
+            ).order_by().values(column).annotate(
+                count=Count('pk')).values('count')
+            self.filter(user_id__in=ids).update(**{
+                field: Coalesce(
+                    Subquery(count, output_field=IntegerField()), 0)})
+
+    def bump(self, user_id, **deltas):
+        """Атомарно сдвинуть счётчики на deltas.
+
+        Если записи ещё нет, ничего не делаем: она будет посчитана
+        с нуля при первом чтении через for_user().
+        """
+        if user_id is None:
+            return
+        self.filter(user_id=user_id).update(**{
+            field: models.F(field) + delta
+            for field, delta in deltas.items()
+        })
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(User,
+                                on_delete=models.CASCADE,
+                                primary_key=True,
+                                related_name='stats')
+    posts_count = models.IntegerField(default=0)
+    comments_count = models.IntegerField(default=0)
+    followers_count = models.IntegerField(default=0)
+    following_count = models.IntegerField(default=0)
+
+    objects = UserStatsManager()
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             related_name='timeline')
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name='timeline_entries')
+    # Копия Post.pub_date, чтобы лента читалась по одному индексу
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        unique_together = ['user', 'post']
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='timeline_user_pub_date_idx'),
+        ]
+
+
+class Task(models.Model):
+    """Фоновая задача в очереди-таблице (см. tasks.py)."""
+    name = models.CharField(max_length=200)
+    # Аргументы в JSON: задачи получают id, а не объекты
+    arguments = models.TextField()
+    attempts = models.PositiveIntegerField(default=0)
+    run_at = models.DateTimeField()
+    # Пока не истекло, задачу выполняет один из воркеров
+    locked_until = models.DateTimeField(null=True, blank=True)
+    failed = models.BooleanField(default=False)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['failed', 'run_at'],
+                         name='task_due_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class BlobManager(models.Manager):
+    def acquire(self, name, count=1):
+        """Добавить count ссылок на файл из хранилища по хэшу."""
+        if not is_blob(name):
+            return
+        if self.filter(name=name).update(refs=F('refs') + count):
+            return
+        try:
+            with transaction.atomic():
+                self.create(name=name, refs=count)
+        except IntegrityError:
+            # Строку только что создал параллельный запрос
+            self.filter(name=name).update(refs=F('refs') + count)
+
+    def release(self, name):
+        """Убрать ссылку; файл без ссылок удаляется после коммита.
+
+        Возвращает False для файлов, сохранённых не этим хранилищем:
+        за ними Blob не следит.
+        """
+        if not is_blob(name):
+            return False
+        self.filter(name=name).update(refs=F('refs') - 1)
+        if self.filter(name=name, refs__lte=0).exists():
+            from .jobs import delete_blob
+            transaction.on_commit(lambda: delete_blob.delay(name))
+        return True
+
+
+class Blob(models.Model):
+    """Файл картинки в хранилище по хэшу и число постов с ним."""
+    name = models.CharField(max_length=100, unique=True)
+    refs = models.IntegerField(default=0)
+
+    objects = BlobManager()
+
+    def __str__(self):
+        return self.name
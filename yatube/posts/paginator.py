@@ -0,0 +1,179 @@
+import base64
+import json
+
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+# Направления перехода, зашитые в курсор
+FORWARD = 'n'
+BACKWARD = 'p'
+
+
+def encode_cursor(direction, pub_date, pk, number=1):
+    payload = json.dumps([direction, pub_date.isoformat(), pk, number])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Вернуть (direction, pub_date, pk, number) или None для битого курсора.
+
+    number - номер страницы, на которую ведёт курсор; в курсорах без
+    номера из старых ссылок считается, что это вторая страница.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, pub_date, pk, *rest = json.loads(
+            base64.urlsafe_b64decode(padded.encode()).decode())
+        pub_date = parse_datetime(pub_date)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        return None
+    if direction not in (FORWARD, BACKWARD) or pub_date is None:
+        return None
+    number = rest.pop() if rest else 2
+    if rest or not isinstance(pk, int) or not isinstance(number, int):
+        return None
+    return direction, pub_date, pk, max(number, 1)
+
+
+def extra_query(request):
+    """Параметры запроса, кроме паджинации, для ссылок на соседние
+    страницы: "q=...&" или пустая строка."""
+    params = request.GET.copy()
+    params.pop('page', None)
+    params.pop('cursor', None)
+    return params.urlencode() + '&' if params else ''
+
+
+class CursorPaginator(Paginator):
+    """Keyset-паджинатор по (pub_date, id).
+
+    Каждая страница - это поиск по индексу от ключа последней показанной
+    записи, поэтому её стоимость не зависит от глубины пролистывания
+    и не требует COUNT(*). Номер страницы передаётся в курсоре, а
+    has_next() и has_previous() отвечают по next_cursor
+    и previous_cursor, тоже без COUNT(*).
+
+    key_sources - список (queryset, поле даты, поле id), из которых
+    берутся ключи ленты; ключи из нескольких источников сливаются.
+    По умолчанию источник один - сам object_list, по которому
+    в любом случае загружаются записи страницы.
+    """
+
+    def __init__(self, object_list, per_page, key_sources=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.key_sources = key_sources or [(object_list, 'pub_date', 'pk')]
+
+    def get_cursor_page(self, cursor=None):
+        decoded = decode_cursor(cursor) if cursor else None
+        if decoded is not None and decoded[0] == BACKWARD:
+            page = self._page_before(*decoded[1:])
+            if page is not None:
+                return page
+            decoded = None
+        return self._page_after(decoded)
+
+    def _keys(self, key, newer):
+        """Ближайшие per_page + 1 ключей после key в нужную сторону."""
+        limit = self.per_page + 1
+        keys = {}
+        for queryset, date_field, pk_field in self.key_sources:
+            if newer:
+                ordering = (date_field, pk_field)
+                lookup = 'gt'
+            else:
+                ordering = ('-' + date_field, '-' + pk_field)
+                lookup = 'lt'
+            queryset = queryset.order_by(*ordering)
+            if key is not None:
+                pub_date, pk = key
+                queryset = queryset.filter(
+                    Q(**{f'{date_field}__{lookup}': pub_date})
+                    | Q(**{date_field: pub_date, f'{pk_field}__{lookup}': pk}))
+            for row in queryset.values_list(date_field, pk_field)[:limit]:
+                keys[row[1]] = row
+        # В каждом источнике взято по limit ключей, поэтому первые limit
+        # ключей объединения - это точно ближайшие ключи всей ленты
+        return sorted(keys.values(), reverse=not newer)[:limit]
+
+    def _build_page(self, keys, next_key, previous_key, number):
+        # Порядок уже известен из ключей, поэтому записи сортируются
+        # здесь, а не в БД: так запрос обходится без временного B-дерева
+        posts = self.object_list.order_by().in_bulk([pk for _, pk in keys])
+        object_list = [posts[pk] for _, pk in keys if pk in posts]
+        # Номер из курсора подправляется, чтобы не спорить с тем,
+        # есть ли перед страницей другие
+        number = max(number, 2) if previous_key is not None else 1
+        next_cursor = previous_cursor = None
+        if next_key is not None:
+            next_cursor = encode_cursor(FORWARD, *next_key, number + 1)
+        if previous_key is not None:
+            previous_cursor = encode_cursor(
+                BACKWARD, *previous_key, number - 1)
+        # Ленты проверяются на точный тип Page, поэтому курсоры и
+        # переходы без COUNT(*) вешаются атрибутами на обычную страницу
+        page = Page(object_list, number, self)
+        page.is_keyset = True
+        page.next_cursor = next_cursor
+        page.previous_cursor = previous_cursor
+        page.has_next = lambda: next_cursor is not None
+        page.has_previous = lambda: previous_cursor is not None
+        page.next_page_number = lambda: number + 1
+        page.previous_page_number = lambda: number - 1
+        return page
+
+    def _page_after(self, decoded):
+        key = decoded[1:3] if decoded is not None else None
+        number = decoded[3] if decoded is not None else 1
+        keys = self._keys(key, newer=False)
+        has_next = len(keys) > self.per_page
+        keys = keys[:self.per_page]
+        next_key = keys[-1] if has_next else None
+        previous_key = keys[0] if key is not None and keys else None
+        return self._build_page(keys, next_key, previous_key, number)
+
+    def _page_before(self, pub_date, pk, number):
+        keys = self._keys((pub_date, pk), newer=True)
+        if len(keys) <= self.per_page:
+            # Дошли до начала ленты - отдаём обычную первую страницу
+            return None
+        keys = keys[:self.per_page][::-1]
+        return self._build_page(keys, keys[-1], keys[0], number)
+
+
+def get_page(request, post_list, per_page, key_sources=None):
+    """Страница ленты по параметрам запроса.
+
+    По умолчанию используется keyset-паджинация по ``?cursor=``;
+    старые ссылки вида ``?page=N`` продолжают работать через OFFSET,
+    если лента не собирается из отдельных источников ключей.
+    """
+    paginator = CursorPaginator(post_list, per_page, key_sources)
+    if (key_sources is None and 'page' in request.GET
+            and 'cursor' not in request.GET):
+        page = paginator.get_page(request.GET.get('page'))
+    else:
+        page = paginator.get_cursor_page(request.GET.get('cursor'))
+    page.extra_query = extra_query(request)
+    return page
+
+
+def get_comments_page(comments, cursor, per_page):
+    """Комментарии от старых к новым и курсор следующей порции.
+
+    Порция берётся по индексу (post, created) от последнего показанного
+    комментария, поэтому подгрузка не зависит от их общего числа.
+    """
+    comments = comments.order_by('created', 'pk')
+    decoded = decode_cursor(cursor) if cursor else None
+    if decoded is not None and decoded[0] == FORWARD:
+        _, created, pk, _ = decoded
+        comments = comments.filter(
+            Q(created__gt=created) | Q(created=created, pk__gt=pk))
+    comments = list(comments[:per_page + 1])
+    next_cursor = None
+    if len(comments) > per_page:
+        comments = comments[:per_page]
+        last = comments[-1]
+        next_cursor = encode_cursor(FORWARD, last.created, last.pk)
+    return comments, next_cursor
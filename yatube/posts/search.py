@@ -0,0 +1,169 @@
+"""Полнотекстовый поиск по постам.
+
+Индекс живёт в отдельной таблице из миграции 0016_post_search: в SQLite
+это виртуальная таблица FTS5, в PostgreSQL - таблица с колонкой tsvector
+и GIN-индексом. Индекс обновляется сигналами
+Post, а rebuild_search_index пересобирает его целиком. На остальных
+СУБД поиск сводится к icontains.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+
+from .models import Post
+
+FTS_TABLE = 'posts_post_fts'
+TSVECTOR_TABLE = 'posts_post_search'
+
+WORD_RE = re.compile(r'\w+')
+
+
+def index_posts(rows):
+    """Проиндексировать пары (id, text), заменив прежние записи."""
+    rows = list(rows)
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.executemany(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                [(pk,) for pk, _ in rows])
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)',
+                rows)
+        elif connection.vendor == 'postgresql':
+            cursor.executemany(
+                f'INSERT INTO {TSVECTOR_TABLE} (post_id, document) '
+                f'VALUES (%s, to_tsvector(%s::regconfig, %s)) '
+                f'ON CONFLICT (post_id) '
+                f'DO UPDATE SET document = EXCLUDED.document',
+                [(pk, settings.SEARCH_CONFIG, text) for pk, text in rows])
+
+
+def remove_post(post_id):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id])
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                f'DELETE FROM {TSVECTOR_TABLE} WHERE post_id = %s',
+                [post_id])
+
+
+def clear():
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f'TRUNCATE {TSVECTOR_TABLE}')
+
+
+def rebuild(queryset=None, batch_size=1000):
+    """Переиндексировать посты пачками; вернуть их количество."""
+    if queryset is None:
+        queryset = Post.objects.all()
+        clear()
+    total = 0
+    batch = []
+    for row in queryset.order_by().values_list('pk', 'text').iterator(
+            chunk_size=batch_size):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            index_posts(batch)
+            total += len(batch)
+            batch = []
+    index_posts(batch)
+    return total + len(batch)
+
+
+def fts_query(query):
+    """Запрос FTS5 из слов пользователя: все слова, каждое как префикс.
+
+    Слова берутся в кавычки, поэтому операторы FTS5 в строке поиска
+    не ломают синтаксис запроса.
+    """
+    return ' '.join(f'"{word}"*' for word in WORD_RE.findall(query))
+
+
+def match_sql(select, query):
+    """SELECT select из индекса по строкам, подходящим под query."""
+    if connection.vendor == 'sqlite':
+        return (f'SELECT {select} FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s', [fts_query(query)])
+    return (f'SELECT {select} FROM {TSVECTOR_TABLE}, '
+            f'plainto_tsquery(%s::regconfig, %s) query '
+            f'WHERE document @@ query',
+            [settings.SEARCH_CONFIG, query])
+
+
+def filter_posts(queryset, query):
+    """Оставить в queryset посты, подходящие под query, без ранжирования:
+    подзапрос к индексу вместо LIKE по всей таблице."""
+    words = WORD_RE.findall(query)
+    if not words:
+        return queryset.none()
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        for word in words:
+            queryset = queryset.filter(text__icontains=word)
+        return queryset
+    sql, params = match_sql(
+        'rowid' if connection.vendor == 'sqlite' else 'post_id', query)
+    return queryset.extra(
+        where=[f'{Post._meta.db_table}.id IN ({sql})'], params=params)
+
+
+class SearchResults:
+    """Ранжированные результаты поиска для стандартного Paginator.
+
+    Paginator вызывает count() и берёт срезы; каждый срез - это один
+    запрос к индексу за id страницы и один запрос за самими постами.
+    """
+
+    def __init__(self, query, queryset=None):
+        self.query = query
+        self.queryset = queryset if queryset is not None else (
+            Post.objects.for_feed())
+        self.words = WORD_RE.findall(query)
+
+    def _fallback(self):
+        queryset = self.queryset
+        for word in self.words:
+            queryset = queryset.filter(text__icontains=word)
+        return queryset.order_by('-pub_date', '-pk')
+
+    def count(self):
+        if not self.words:
+            return 0
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            return self._fallback().count()
+        sql, params = match_sql('COUNT(*)', self.query)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        if not self.words:
+            return []
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            return list(self._fallback()[index])
+        start = index.start or 0
+        if connection.vendor == 'sqlite':
+            sql, params = match_sql('rowid', self.query)
+            sql += ' ORDER BY rank, rowid DESC'
+        else:
+            sql, params = match_sql('post_id', self.query)
+            sql += ' ORDER BY ts_rank(document, query) DESC, post_id DESC'
+        sql += ' LIMIT %s OFFSET %s'
+        params += [index.stop - start, start]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            ids = [row[0] for row in cursor.fetchall()]
+        posts = self.queryset.order_by().in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
@@ -0,0 +1,113 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import jobs, timeline
+from .caching import (FEED_VERSION_KEY, bump_version, group_version_key,
+                      post_version_key, user_feed_version_key)
+from .models import Blob, Comment, Follow, Group, Post
+
+# Счётчики, ленты подписок и поисковый индекс обновляются фоновыми
+# задачами (см. jobs.py); версии кэша сдвигаются сразу, чтобы автор
+# увидел свою запись на следующей же странице
+
+
+@receiver(post_save, sender=Post)
+def post_created(sender, instance, created, **kwargs):
+    if created:
+        jobs.bump_stats.delay(instance.author_id, posts_count=1)
+        jobs.fan_out.delay(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    jobs.bump_stats.delay(instance.author_id, posts_count=-1)
+
+
+@receiver(post_save, sender=Post)
+def post_indexed(sender, instance, **kwargs):
+    jobs.index_post.delay(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_unindexed(sender, instance, **kwargs):
+    jobs.unindex_post.delay(instance.pk)
+
+
+@receiver(pre_save, sender=Post)
+def post_image_changing(sender, instance, **kwargs):
+    # Новую загрузку сохранит хранилище, и ссылку на неё возьмёт оно же
+    instance._image_uploaded = bool(
+        instance.image and not instance.image._committed)
+    instance._old_image = None
+    if not instance._state.adding:
+        instance._old_image = Post.objects.filter(
+            pk=instance.pk).values_list('image', flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+def post_image_changed(sender, instance, **kwargs):
+    old, new = getattr(instance, '_old_image', None), instance.image.name
+    if (old or None) == (new or None):
+        if new and instance._image_uploaded:
+            # Заново загрузили тот же файл: хранилище взяло лишнюю ссылку
+            Blob.objects.release(new)
+        return
+    if new and not instance._image_uploaded:
+        Blob.objects.acquire(new)
+    if old:
+        Blob.objects.release(old)
+
+
+@receiver(post_delete, sender=Post)
+def post_image_released(sender, instance, **kwargs):
+    if instance.image:
+        Blob.objects.release(instance.image.name)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created:
+        jobs.bump_stats.delay(instance.author_id, comments_count=1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    jobs.bump_stats.delay(instance.author_id, comments_count=-1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        jobs.refresh_follow_stats.delay(
+            instance.user_id, instance.author_id)
+        if instance.author_id is not None:
+            jobs.backfill.delay(instance.user_id, instance.author_id)
+        bump_version(user_feed_version_key(instance.user_id))
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    jobs.refresh_follow_stats.delay(instance.user_id, instance.author_id)
+    timeline.prune(instance.user_id, [instance.author_id])
+    bump_version(user_feed_version_key(instance.user_id))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_changed(sender, instance, **kwargs):
+    bump_version(post_version_key(instance.pk))
+    bump_version(FEED_VERSION_KEY)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_changed(sender, instance, **kwargs):
+    bump_version(post_version_key(instance.post_id))
+    bump_version(FEED_VERSION_KEY)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    bump_version(group_version_key(instance.pk))
+    bump_version(FEED_VERSION_KEY)
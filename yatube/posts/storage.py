@@ -0,0 +1,71 @@
+"""Хранилище картинок постов по хэшу содержимого.
+
+Файл сохраняется под именем из SHA-256 содержимого:
+posts/ab/cd/abcd....jpg. Хэш считается по ходу записи, кусками, так что
+файл не читается в память целиком. Одинаковые загрузки получают одно
+имя и один файл на диске, а значит, и одни миниатюры sorl-thumbnail:
+их ключ строится из имени исходника.
+
+Сколько постов ссылается на файл, хранит Blob (см. models.py).
+Хранилище берёт ссылку до записи файла, а удаляет файл задача
+jobs.delete_blob, когда ссылок не осталось; обе стороны меняют одну
+строку Blob, поэтому параллельная загрузка того же файла не потеряет
+его из-за удаления.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+BLOB_NAME_RE = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.\w+$')
+
+
+def is_blob(name):
+    """Сохранено ли name этим хранилищем (а не, скажем, до его появления)."""
+    return bool(name and BLOB_NAME_RE.search(name))
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # Имя задаёт содержимое: совпадение имён - это тот же файл
+        return name
+
+    def _save(self, name, content):
+        from .models import Blob
+
+        directory, extension = os.path.dirname(name), os.path.splitext(
+            name)[1].lower()
+        os.makedirs(self.path(directory), exist_ok=True)
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(
+            dir=self.path(directory), suffix='.upload')
+        try:
+            with os.fdopen(fd, 'wb') as temp:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp.write(chunk)
+            hexdigest = digest.hexdigest()
+            name = '/'.join(filter(None, [
+                directory, hexdigest[:2], hexdigest[2:4],
+                hexdigest + extension]))
+            Blob.objects.acquire(name)
+            path = self.path(name)
+            if os.path.exists(path):
+                os.remove(temp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(temp_path, path)
+                if self.file_permissions_mode is not None:
+                    os.chmod(path, self.file_permissions_mode)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return name
+
+
+blob_storage = ContentAddressedStorage()
@@ -0,0 +1,245 @@
+"""Фоновые задачи: побочные эффекты сохранения вне пути запроса.
+
+Функция, обёрнутая в @task, по-прежнему вызывается напрямую, а её
+.delay(*args, **kwargs) ставит вызов в очередь. Где выполняется
+задача, задаёт TASKS_BACKEND:
+
+    sync    - после коммита транзакции, в том же потоке и без повторов
+              (только тесты);
+    thread  - в пуле потоков этого же процесса после коммита транзакции
+              (по умолчанию);
+    process - в пуле отдельных процессов после коммита транзакции;
+    db      - строкой в таблице Task в той же транзакции, что и данные;
+              выполняет её отдельный воркер: manage.py run_tasks.
+
+Упавшая задача повторяется до TASKS_MAX_ATTEMPTS раз с экспоненциальной
+задержкой; пока она ждёт повтора, потоки и процессы пула заняты другими
+задачами. Каждая попытка выполняется в одной транзакции, и в очереди-
+таблице удаление задачи коммитится вместе с её изменениями, так что
+задача с неидемпотентными изменениями (например, сдвиг счётчиков)
+не применится дважды. Идемпотентная задача, которая долго работает
+без записи в базу, объявляется с @task(atomic=False): транзакция
+SQLite (BEGIN IMMEDIATE) держала бы блокировку записи всё это время.
+Аргументы должны сериализоваться в JSON, поэтому задачи получают id,
+а не объекты моделей.
+"""
+import json
+import logging
+import random
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from functools import wraps
+from importlib import import_module
+from multiprocessing import get_context
+
+import django
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+_executors = {}
+# Пул создают и запросы, и таймеры повторов
+_executors_lock = threading.Lock()
+
+
+def task(func=None, *, max_attempts=None, atomic=True):
+    """Зарегистрировать функцию как задачу и добавить ей .delay()."""
+    if func is None:
+        return lambda func: task(
+            func, max_attempts=max_attempts, atomic=atomic)
+    name = f'{func.__module__}.{func.__qualname__}'
+
+    @wraps(func)
+    def delay(*args, **kwargs):
+        enqueue(name, args, kwargs)
+
+    func.task_name = name
+    func.max_attempts = max_attempts
+    func.atomic = atomic
+    func.delay = delay
+    registry[name] = func
+    return func
+
+
+class LeaseLost(Exception):
+    """Задачу из таблицы, пока она выполнялась, забрал другой воркер."""
+
+
+def resolve(name):
+    # В процессе пула модуль с задачей мог ещё не импортироваться
+    if name not in registry:
+        import_module(name.rpartition('.')[0])
+    return registry[name]
+
+
+def attempt_transaction(func):
+    return transaction.atomic() if func.atomic else nullcontext()
+
+
+def get_max_attempts(name):
+    func = registry.get(name)
+    return getattr(func, 'max_attempts', None) or settings.TASKS_MAX_ATTEMPTS
+
+
+def backoff(attempt):
+    """Задержка перед повтором номер attempt, с разбросом, чтобы
+    задачи, упавшие вместе, не повторялись одновременно."""
+    delay = min(settings.TASKS_RETRY_DELAY * 2 ** (attempt - 1),
+                settings.TASKS_RETRY_MAX_DELAY)
+    return delay * random.uniform(0.5, 1)
+
+
+def get_executor(backend):
+    with _executors_lock:
+        if backend not in _executors:
+            if backend == 'thread':
+                _executors[backend] = ThreadPoolExecutor(
+                    max_workers=settings.TASKS_WORKERS,
+                    thread_name_prefix='tasks')
+            else:
+                # spawn, а не fork: дочерний процесс не должен унаследовать
+                # открытые соединения с базой
+                _executors[backend] = ProcessPoolExecutor(
+                    max_workers=settings.TASKS_WORKERS,
+                    mp_context=get_context('spawn'), initializer=django.setup)
+        return _executors[backend]
+
+
+def enqueue(name, args=(), kwargs=None):
+    kwargs = kwargs or {}
+    backend = settings.TASKS_BACKEND
+    if backend == 'sync':
+        transaction.on_commit(lambda: run_once(name, args, kwargs))
+    elif backend == 'db':
+        Task.objects.create(
+            name=name, arguments=json.dumps([list(args), kwargs]),
+            run_at=timezone.now())
+    elif backend in ('thread', 'process'):
+        # Задача должна увидеть закоммиченную строку
+        transaction.on_commit(lambda: submit(backend, name, args, kwargs))
+    else:
+        raise ValueError(f'Неизвестный TASKS_BACKEND: {backend}')
+
+
+def run_once(name, args, kwargs):
+    # Без повторов: запрос не должен ждать задержек между попытками
+    # и падать из-за задачи, которую он поставил
+    func = registry[name]
+    try:
+        with attempt_transaction(func):
+            func(*args, **kwargs)
+    except Exception:
+        logger.exception('Задача %s не выполнена', name)
+
+
+def run_in_pool(name, args, kwargs):
+    """Одна попытка задачи в потоке или процессе пула."""
+    func = resolve(name)
+    try:
+        with attempt_transaction(func):
+            func(*args, **kwargs)
+    finally:
+        connections.close_all()
+
+
+def submit(backend, name, args, kwargs, attempt=1):
+    future = get_executor(backend).submit(run_in_pool, name, args, kwargs)
+    future.add_done_callback(
+        lambda future: retry_failed(future, backend, name, args, kwargs,
+                                    attempt))
+    return future
+
+
+def retry_failed(future, backend, name, args, kwargs, attempt):
+    """Поставить упавшую задачу на повтор таймером.
+
+    Задержка перед повтором не занимает поток или процесс пула.
+    """
+    error = future.exception()
+    if error is None:
+        return
+    if isinstance(error, BrokenProcessPool):
+        # Процесс пула умер; следующая попытка создаст новый пул
+        with _executors_lock:
+            _executors.pop(backend, None)
+    if attempt >= get_max_attempts(name):
+        logger.error('Задача %s не выполнена за %d попыток', name, attempt,
+                     exc_info=error)
+        return
+    logger.warning('Задача %s упала, попытка %d', name, attempt,
+                   exc_info=error)
+    timer = threading.Timer(
+        backoff(attempt), submit, (backend, name, args, kwargs, attempt + 1))
+    timer.daemon = True
+    timer.start()
+
+
+def claim(limit):
+    """Забрать до limit готовых задач из таблицы.
+
+    Задача помечается locked_until одним UPDATE с тем же условием, что
+    и при выборке, поэтому два воркера не возьмут одну задачу.
+    """
+    now = timezone.now()
+    free = Q(locked_until__isnull=True) | Q(locked_until__lt=now)
+    due = Task.objects.filter(free, failed=False, run_at__lte=now)
+    claimed = []
+    for pk in due.order_by('run_at').values_list('pk', flat=True)[:limit]:
+        if Task.objects.filter(free, pk=pk).update(
+                locked_until=now + timedelta(seconds=settings.TASKS_LEASE)):
+            claimed.append(pk)
+    return Task.objects.filter(pk__in=claimed).order_by('run_at')
+
+
+def execute(job):
+    args, kwargs = json.loads(job.arguments)
+    try:
+        if job.name not in registry:
+            raise LookupError(f'Задача {job.name} не зарегистрирована')
+        func = registry[job.name]
+        with attempt_transaction(func):
+            func(*args, **kwargs)
+            # Задача удаляется в той же транзакции, что и её изменения,
+            # и только если за ней ещё наша аренда: иначе после падения
+            # воркера или истечения TASKS_LEASE она применилась бы дважды
+            if not Task.objects.filter(
+                    pk=job.pk, locked_until=job.locked_until).delete()[0]:
+                raise LeaseLost(job.pk)
+    except LeaseLost:
+        logger.warning('Задачу %s уже выполняет другой воркер', job.name)
+        return False
+    except Exception as error:
+        job.attempts += 1
+        job.locked_until = None
+        job.last_error = repr(error)
+        if job.attempts >= get_max_attempts(job.name):
+            job.failed = True
+            logger.exception('Задача %s не выполнена за %d попыток',
+                             job.name, job.attempts)
+        else:
+            job.run_at = timezone.now() + timedelta(
+                seconds=backoff(job.attempts))
+        job.save(update_fields=[
+            'attempts', 'locked_until', 'last_error', 'failed', 'run_at'])
+        return False
+    return True
+
+
+def run_pending(limit=100):
+    """Выполнить готовые задачи из таблицы; вернуть (успешно, с ошибкой)."""
+    done = failed = 0
+    for job in claim(limit):
+        if execute(job):
+            done += 1
+        else:
+            failed += 1
+    return done, failed
@@ -0,0 +1,36 @@
+from django import template
+from django.conf import settings
+
+from ..thumbnails import cached_srcset, schedule, sizes
+
+register = template.Library()
+
+
+@register.inclusion_tag('includes/post_image.html')
+def post_image(post, variant, css_class='', column=''):
+    """<picture> с миниатюрами варианта из THUMBNAIL_SRCSET.
+
+    column - класс колонки Bootstrap вокруг картинки, из него
+    считается sizes (см. thumbnails.sizes).
+
+    Пока миниатюры не нарезаны, показывается исходная картинка, а нарезка
+    ставится в очередь: отрисовка ленты никогда не ждёт обработки
+    изображений.
+    """
+    srcset = cached_srcset(post.image.name, variant)
+    if srcset is None:
+        # Под sync задача выполнилась бы прямо при отрисовке; там
+        # миниатюры нарезает только задача после сохранения поста
+        if settings.TASKS_BACKEND != 'sync':
+            schedule(post)
+        return {
+            'src': post.image.url,
+            'width': post.image_width,
+            'height': post.image_height,
+            'css_class': css_class,
+        }
+    return {
+        **srcset,
+        'sizes': sizes(column),
+        'css_class': css_class,
+    }
@@ -0,0 +1,91 @@
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from posts.admin import estimated_count
+from posts.models import Comment, Follow, Group, Post, User
+from posts.tests.utils import run_on_commit
+
+
+class AdminPerformanceTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        cls.authors = [
+            User.objects.create(username=f'author{number}')
+            for number in range(5)]
+        group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        with run_on_commit():
+            for author in cls.authors:
+                post = Post.objects.create(
+                    text=f'Ёжик в тумане {author.username}', author=author,
+                    group=group)
+                Comment.objects.create(post=post, author=author, text='Текст')
+                Follow.objects.create(user=cls.admin, author=author)
+            Post.objects.create(text='Лошадка', author=cls.authors[0])
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def changelist(self, model, **params):
+        url = reverse(f'admin:posts_{model}_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in queries]
+
+    def test_changelists_select_related(self):
+        for model in ('post', 'comment', 'follow'):
+            with self.subTest(model=model):
+                _, before = self.changelist(model)
+                author = User.objects.create(username=f'more_{model}')
+                post = Post.objects.create(text='Ещё', author=author)
+                Comment.objects.create(post=post, author=author, text='Ещё')
+                Follow.objects.create(user=author, author=self.admin)
+                _, after = self.changelist(model)
+                self.assertEqual(len(before), len(after))
+
+    def test_no_full_count_on_filtered_list(self):
+        _, queries = self.changelist(
+            'follow', author__id__exact=self.authors[0].pk)
+        counts = [sql for sql in queries if 'COUNT(' in sql]
+        self.assertEqual(len(counts), 1)
+        self.assertIn('WHERE', counts[0])
+
+    @override_settings(ADMIN_COUNT_ESTIMATE_THRESHOLD=1)
+    def test_estimated_count(self):
+        self.assertIsNone(estimated_count(Post, 'default'))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertEqual(estimated_count(Post, 'default'), 6)
+        response, queries = self.changelist('post')
+        self.assertFalse([sql for sql in queries if 'COUNT(' in sql])
+        self.assertEqual(response.context['cl'].result_count, 6)
+
+    def test_autocomplete_filter(self):
+        User.objects.create(username='not_in_sidebar')
+        response, _ = self.changelist(
+            'follow', author__id__exact=self.authors[1].pk)
+        self.assertEqual(response.context['cl'].result_count, 1)
+        self.assertNotContains(response, 'not_in_sidebar')
+        self.assertContains(response, reverse('admin:auth_user_autocomplete'))
+        self.assertContains(
+            response, f'<option value="{self.authors[1].pk}" selected>'
+            f'{self.authors[1].username}</option>', html=True)
+        self.assertContains(response, 'select2')
+        response = self.client.get(
+            reverse('admin:auth_user_autocomplete'), {'term': 'author1'})
+        self.assertEqual(
+            [item['text'] for item in response.json()['results']],
+            ['author1'])
+
+    def test_search_uses_index(self):
+        response, queries = self.changelist('post', q='ёжик author1')
+        self.assertEqual(
+            [post.text for post in response.context['cl'].result_list],
+            ['Ёжик в тумане author1'])
+        search_sql = [sql for sql in queries if 'posts_post_fts' in sql]
+        self.assertTrue(search_sql)
+        self.assertFalse([sql for sql in search_sql if 'LIKE' in sql])
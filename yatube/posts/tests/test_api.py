@@ -0,0 +1,132 @@
+import time
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils.http import http_date
+from posts.models import Comment, Follow, Group, Post, User
+from posts.tests.utils import run_on_commit
+from yatube.settings import PAGE_SIZE
+
+
+class FeedApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        with run_on_commit():
+            for number in range(PAGE_SIZE + 2):
+                self.post = Post.objects.create(
+                    text=f'Пост {number}', author=self.author,
+                    group=self.group)
+            Comment.objects.create(
+                post=self.post, author=self.reader, text='Комментарий')
+            Follow.objects.create(user=self.reader, author=self.author)
+        self.client.force_login(self.reader)
+        self.urls = [
+            reverse('api:index'),
+            reverse('api:group_posts', kwargs={'slug': 'group'}),
+            reverse('api:profile', kwargs={'username': 'author'}),
+            reverse('api:follow_index'),
+        ]
+
+    def test_feeds_serialize_posts_with_cursors(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                data = self.client.get(url).json()
+                self.assertEqual(len(data['results']), PAGE_SIZE)
+                first = data['results'][0]
+                self.assertEqual(first['text'], self.post.text)
+                self.assertEqual(first['author'], 'author')
+                self.assertEqual(first['group'], 'group')
+                self.assertEqual(first['comments'], 1)
+                second = self.client.get(
+                    url, {'cursor': data['next']}).json()
+                self.assertEqual(len(second['results']), 2)
+                self.assertIsNone(second['next'])
+
+    def test_post_view(self):
+        url = reverse('api:post', kwargs={
+            'username': 'author', 'post_id': self.post.pk})
+        data = self.client.get(url).json()
+        self.assertEqual(data['id'], self.post.pk)
+        self.assertEqual(data['comment_list'][0]['author'], 'reader')
+
+    def test_not_modified_skips_post_rows(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertNotIn('Last-Modified', response)
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(
+                        url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+                selects = ' '.join(
+                    query['sql'] for query in queries.captured_queries)
+                self.assertNotIn('"posts_post"."text"', selects)
+
+    def test_etag_changes_with_feed(self):
+        url = reverse('api:index')
+        etag = self.client.get(url)['ETag']
+        with run_on_commit():
+            Post.objects.create(text='Новый', author=self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['text'], 'Новый')
+
+    def test_follow_feed_etag_changes_on_unfollow(self):
+        url = reverse('api:follow_index')
+        etag = self.client.get(url)['ETag']
+        with run_on_commit():
+            self.client.get(reverse('profile_unfollow', kwargs={
+                'username': 'author'}))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_comment_changes_post_etag(self):
+        url = reverse('api:post', kwargs={
+            'username': 'author', 'post_id': self.post.pk})
+        etag = self.client.get(url)['ETag']
+        with run_on_commit():
+            Comment.objects.create(
+                post=self.post, author=self.author, text='Ответ')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_group_edit_changes_post_etag(self):
+        url = reverse('api:post', kwargs={
+            'username': 'author', 'post_id': self.post.pk})
+        etag = self.client.get(url)['ETag']
+        self.group.slug = 'renamed'
+        with run_on_commit():
+            self.group.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['group'], 'renamed')
+
+    def test_if_modified_since_does_not_hide_edits(self):
+        self.post.text = 'Исправленный текст'
+        with run_on_commit():
+            self.post.save()
+        response = self.client.get(
+            reverse('api:index'),
+            HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()['results'][0]['text'], 'Исправленный текст')
+
+    def test_follow_feed_requires_login(self):
+        self.client.logout()
+        response = self.client.get(reverse('api:follow_index'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_api_does_not_shadow_user_pages(self):
+        for url in ('/api/', '/api/5/', '/api/follow/'):
+            with self.subTest(url=url):
+                self.assertNotEqual(resolve(url).namespace, 'api')
+        self.assertEqual(reverse('api:index'), '/api/v1/posts/')
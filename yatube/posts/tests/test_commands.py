@@ -0,0 +1,239 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from posts.management.commands.import_posts import Command
+from posts.models import Follow, Group, Post, TimelineEntry, User, UserStats
+
+
+class ImportPostsTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def write(self, rows, suffix='.jsonl'):
+        file = tempfile.NamedTemporaryFile(
+            'w', suffix=suffix, delete=False, encoding='utf-8')
+        with file:
+            if suffix == '.csv':
+                file.write('text,author,group,pub_date\n')
+                file.writelines(','.join(row) + '\n' for row in rows)
+            else:
+                file.writelines(json.dumps(row) + '\n' for row in rows)
+        self.addCleanup(os.remove, file.name)
+        return file.name
+
+    def test_import_keeps_pub_date_and_skips_unknown(self):
+        path = self.write([
+            {'text': 'Первый', 'author': 'author', 'group': 'group',
+             'pub_date': '2015-06-01T10:00:00+00:00'},
+            {'text': 'Второй', 'author': 'author'},
+            {'text': 'Чужой', 'author': 'nobody'},
+            {'text': 'Без группы', 'author': 'author', 'group': 'missing'},
+        ])
+        out = StringIO()
+        call_command('import_posts', path, stdout=out)
+        self.assertEqual(Post.objects.count(), 2)
+        post = Post.objects.get(text='Первый')
+        self.assertEqual(post.group, self.group)
+        self.assertEqual(post.pub_date.year, 2015)
+        self.assertIn('пропущено 2', out.getvalue())
+
+    def test_import_does_not_touch_pub_date_field(self):
+        import_batch = Command.import_batch
+
+        def save_during_import(command, batch):
+            # Обычное сохранение посреди загрузки получает текущую дату
+            post = Post.objects.create(text='Из формы', author=self.author)
+            self.assertIsNotNone(post.pub_date)
+            return import_batch(command, batch)
+
+        path = self.write([{'text': 'Старый', 'author': 'author',
+                            'pub_date': '2015-06-01T10:00:00+00:00'}])
+        with mock.patch.object(Command, 'import_batch', save_during_import):
+            call_command('import_posts', path, stdout=StringIO())
+        self.assertTrue(Post._meta.get_field('pub_date').auto_now_add)
+        self.assertEqual(Post.objects.get(text='Старый').pub_date.year, 2015)
+
+    def test_skips_malformed_lines_and_unsafe_images(self):
+        path = self.write([
+            {'text': 'Первый', 'author': 'author'},
+            {'text': 'Абсолютный', 'author': 'author',
+             'image': '/etc/passwd'},
+            {'text': 'Наружу', 'author': 'author',
+             'image': 'posts/../../settings.py'},
+            {'text': 'С картинкой', 'author': 'author',
+             'image': 'posts/old.gif'},
+        ])
+        with open(path, 'a', encoding='utf-8') as file:
+            file.write('{"text": "оборвано\n[1, 2]\n')
+            file.write(json.dumps({'text': 'После', 'author': 'author'}))
+        out = StringIO()
+        call_command('import_posts', path, '--batch-size', '2', stdout=out)
+        self.assertEqual(
+            sorted(Post.objects.values_list('text', flat=True)),
+            ['Первый', 'После', 'С картинкой'])
+        self.assertIn('пропущено 4', out.getvalue())
+
+    def test_skips_invalid_dates(self):
+        path = self.write([
+            {'text': 'Первый', 'author': 'author'},
+            {'text': 'Не дата', 'author': 'author', 'pub_date': 'вчера'},
+            {'text': 'Нет дня', 'author': 'author',
+             'pub_date': '2020-13-45T10:00:00'},
+            {'text': 'Число', 'author': 'author', 'pub_date': 1591005600},
+        ])
+        out = StringIO()
+        call_command('import_posts', path, stdout=out)
+        self.assertEqual(
+            list(Post.objects.values_list('text', flat=True)), ['Первый'])
+        self.assertIn('пропущено 3', out.getvalue())
+
+    def test_batches_use_constant_queries(self):
+        # Пачки меньше лимита параметров SQLite на один INSERT
+        rows = [{'text': f'Пост {i}', 'author': 'author', 'group': 'group'}
+                for i in range(25)]
+        path = self.write(rows)
+        with CaptureQueriesContext(connection) as small:
+            call_command('import_posts', path, '--batch-size', '25',
+                         stdout=StringIO())
+        path = self.write(rows * 4)
+        with CaptureQueriesContext(connection) as large:
+            call_command('import_posts', path, '--batch-size', '100',
+                         stdout=StringIO())
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(Post.objects.count(), 125)
+
+    def test_csv_and_create_authors(self):
+        path = self.write([
+            ('Новый автор', 'newcomer', '', '2020-01-01T00:00:00'),
+        ], suffix='.csv')
+        call_command('import_posts', path, '--create-authors',
+                     stdout=StringIO())
+        post = Post.objects.get()
+        self.assertEqual(post.author.username, 'newcomer')
+        self.assertFalse(post.author.has_usable_password())
+
+    def test_stats_and_timeline_follow_import(self):
+        UserStats.objects.for_user(self.author)
+        path = self.write([{'text': 'Из архива', 'author': 'author'}])
+        call_command('import_posts', path, stdout=StringIO())
+        self.assertEqual(
+            UserStats.objects.for_user(self.author).posts_count, 1)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post__text='Из архива').exists())
+
+
+class ExportPostsTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        Post.objects.bulk_create(
+            Post(text=f'Пост {i}', author=self.author, group=self.group)
+            for i in range(5))
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def test_export_round_trips_through_import(self):
+        out = StringIO()
+        call_command('export_posts', '--chunk-size', '2', stdout=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['author'], 'author')
+        self.assertEqual(rows[0]['group'], 'group')
+        with tempfile.NamedTemporaryFile(
+                'w', suffix='.jsonl', delete=False, encoding='utf-8') as file:
+            file.write(out.getvalue())
+        self.addCleanup(os.remove, file.name)
+        call_command('import_posts', file.name, stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 10)
+
+    def test_export_csv_follows(self):
+        out = StringIO()
+        call_command('export_posts', 'follows', '--format', 'csv',
+                     stdout=out)
+        self.assertEqual(
+            out.getvalue().splitlines(), ['user,author', 'reader,author'])
+
+    def test_export_endpoint_streams_for_staff_only(self):
+        url = reverse('export', kwargs={'kind': 'comments'})
+        client = Client()
+        client.force_login(self.reader)
+        response = client.get(url)
+        self.assertEqual(response.status_code, 302)
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        client.force_login(staff)
+        response = client.get(reverse('export', kwargs={'kind': 'posts'}),
+                              {'format': 'csv'})
+        self.assertTrue(response.streaming)
+        body = b''.join(response.streaming_content).decode()
+        self.assertEqual(len(body.splitlines()), 6)
+        self.assertEqual(client.get(
+            reverse('export', kwargs={'kind': 'users'})).status_code, 404)
+
+
+class BenchmarkTest(TestCase):
+    def test_seed_and_measure(self):
+        call_command('bench_seed', '--users', '20', '--groups', '2',
+                     '--posts', '60', '--follows', '80', '--comments', '50',
+                     '--batch-size', '25', stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 60)
+        # Даты публикации разбросаны, а поле модели не тронуто
+        self.assertGreater(
+            Post.objects.values('pub_date').distinct().count(), 1)
+        self.assertTrue(Post._meta.get_field('pub_date').auto_now_add)
+        self.assertEqual(
+            UserStats.objects.count(), User.objects.count())
+        self.assertTrue(TimelineEntry.objects.exists())
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'bench.json')
+            call_command('bench_feeds', '--requests', '3', '--warmup', '1',
+                         '--output', output, stdout=StringIO())
+            with open(output, encoding='utf-8') as file:
+                report = json.load(file)
+            out = StringIO()
+            call_command('bench_feeds', '--requests', '2', '--warmup', '0',
+                         '--views', 'index', '--output', output,
+                         '--compare', output, stdout=out)
+        self.assertEqual(report['volumes']['posts'], 60)
+        self.assertEqual(set(report['views']), {
+            'index', 'group_posts', 'profile', 'post_view', 'follow_index'})
+        for summary in report['views'].values():
+            self.assertEqual(summary['requests'], 3)
+            self.assertLessEqual(summary['p50_ms'], summary['p99_ms'])
+        self.assertIn('index: p50', out.getvalue())
+
+
+class BenchWritersTest(TransactionTestCase):
+    # Писатель работает в своём потоке и видит только закоммиченное.
+    # Тестовая база в памяти блокирует таблицы целиком и не ждёт
+    # busy_timeout, поэтому писатель здесь один
+    def test_writer_throughput(self):
+        author = User.objects.create_user(username='author')
+        post = Post.objects.create(text='Пост', author=author)
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'writers.json')
+            call_command('bench_writers', '--workers', '1', '--requests',
+                         '3', '--output', output, stdout=StringIO())
+            with open(output, encoding='utf-8') as file:
+                report = json.load(file)
+        self.assertEqual(report['database']['vendor'], 'sqlite')
+        self.assertEqual(report['database']['busy_timeout'], 5000)
+        self.assertEqual(
+            Post.objects.filter(text='Замер записи').count(), 3)
+        self.assertEqual(post.comments.count(), 3)
+        for summary in report['views'].values():
+            self.assertEqual(summary['requests'], 3)
+            self.assertEqual(summary['errors'], 0)
+            self.assertGreater(summary['per_second'], 0)
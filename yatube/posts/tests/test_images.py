@@ -0,0 +1,146 @@
+import io
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image, ImageCms
+from posts import images, jobs
+from posts.forms import PostForm
+from posts.models import Blob, Post, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def make_image(size, image_format='JPEG', mode='RGB', exif=None,
+               color='red'):
+    file = io.BytesIO()
+    options = {'exif': exif} if exif else {}
+    Image.new(mode, size, color).save(file, image_format, **options)
+    return file.getvalue()
+
+
+def camera_exif(orientation):
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    exif[0x010F] = 'Camera maker'
+    return exif.tobytes()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_MAX_SIZE=(200, 200),
+                   IMAGE_WORKERS=0)
+class ImagePipelineTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='author')
+        self.client.force_login(self.user)
+
+    def upload(self, content, name='photo.JPG'):
+        return SimpleUploadedFile(name, content, content_type='image/jpeg')
+
+    def test_downscales_and_strips_exif(self):
+        # Ориентация 6: камера держалась боком, картинку надо повернуть
+        content = make_image((800, 400), exif=camera_exif(6))
+        self.client.post(reverse('new_post'), {
+            'text': 'Фото', 'image': self.upload(content)})
+        post = Post.objects.get()
+        self.assertTrue(post.image.name.startswith('posts/'))
+        self.assertTrue(post.image.name.endswith('.jpg'))
+        self.assertEqual((post.image_width, post.image_height), (100, 200))
+        self.assertEqual(post.image_size, post.image.size)
+        self.assertLess(post.image_size, len(content))
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.size, (100, 200))
+            self.assertEqual(len(stored.getexif()), 0)
+            self.assertIn('progressive', stored.info)
+
+    @override_settings(IMAGE_FORMAT='WEBP')
+    def test_webp_keeps_transparency(self):
+        content = make_image(
+            (300, 300), 'PNG', 'RGBA', color=(255, 0, 0, 128))
+        form = PostForm(
+            {'text': 'Фото'}, {'image': self.upload(content, 'logo.png')})
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data['image'].name, 'logo.webp')
+        with Image.open(form.cleaned_data['image']) as stored:
+            self.assertEqual(stored.format, 'WEBP')
+            self.assertEqual(stored.mode, 'RGBA')
+
+    def test_clearing_image_resets_dimensions(self):
+        self.client.post(reverse('new_post'), {
+            'text': 'Фото', 'image': self.upload(make_image((50, 50)))})
+        post = Post.objects.get()
+        self.client.post(
+            reverse('post_edit', args=['author', post.pk]),
+            {'text': 'Без фото', 'image-clear': 'on'})
+        post.refresh_from_db()
+        self.assertFalse(post.image)
+        self.assertIsNone(post.image_size)
+
+    def test_broken_image(self):
+        form = PostForm({'text': 'Фото'}, {
+            'image': self.upload(make_image((50, 50))[:100])})
+        self.assertFalse(form.is_valid())
+        self.assertIn('image', form.errors)
+
+    def encode(self, image, **options):
+        file = io.BytesIO()
+        image.save(file, **options)
+        content, _, _ = images.encode(file.getvalue(), (200, 200), 'JPEG', 90)
+        return Image.open(io.BytesIO(content))
+
+    def test_palette_is_resampled_smoothly(self):
+        # Чередование чёрных и белых столбцов при LANCZOS даёт серый,
+        # при NEAREST остались бы чистые цвета
+        stripes = Image.new('L', (400, 400))
+        stripes.putdata([255 * (x % 2) for _ in range(400)
+                         for x in range(400)])
+        with self.encode(stripes.convert('P'), format='GIF') as stored:
+            self.assertEqual(stored.mode, 'RGB')
+            self.assertTrue(60 < stored.getpixel((100, 100))[0] < 200)
+
+    def test_cmyk_profile_is_not_attached_to_rgb(self):
+        with self.encode(Image.new('CMYK', (50, 50)), format='JPEG',
+                         icc_profile=b'not a cmyk profile') as stored:
+            self.assertEqual(stored.mode, 'RGB')
+            self.assertNotIn('icc_profile', stored.info)
+        srgb = ImageCms.ImageCmsProfile(
+            ImageCms.createProfile('sRGB')).tobytes()
+        with self.encode(Image.new('RGB', (50, 50)), format='JPEG',
+                         icc_profile=srgb) as stored:
+            self.assertEqual(stored.info['icc_profile'], srgb)
+
+    def test_broken_pool_is_reset_once(self):
+        broken, fresh = object(), object()
+        self.addCleanup(setattr, images, '_pool', None)
+        images._pool = fresh
+        images.reset_pool(broken)
+        self.assertIs(images._pool, fresh)
+        images.reset_pool(fresh)
+        self.assertIsNone(images._pool)
+
+    @override_settings(IMAGE_WORKERS=1)
+    def test_process_pool_and_backfill(self):
+        post = Post.objects.create(
+            text='Старое фото', author=self.user,
+            image=self.upload(make_image((600, 600)), 'old.png'))
+        original = post.image.name
+        out = StringIO()
+        call_command('process_post_images', stdout=out)
+        self.assertIn('Обработано: 1', out.getvalue())
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (200, 200))
+        self.assertTrue(post.image.name.endswith('.jpg'))
+        # Файл без ссылок удаляет задача после коммита
+        self.assertFalse(Blob.objects.get(name=original).refs)
+        jobs.delete_blob(original)
+        self.assertFalse(post.image.storage.exists(original))
+        self.assertEqual(post.image.size, post.image_size)
@@ -1,5 +1,12 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
-from posts.models import Group, Post, User
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from posts.models import Comment, Follow, Group, Post, User, UserStats
+from posts.tests.utils import run_on_commit
 
 
 class ModelsTest(TestCase):
@@ -27,3 +34,58 @@ class ModelsTest(TestCase):
         group = ModelsTest.group
         group_str = str(group)
         self.assertEqual(group_str, 'Тестовый заголовок')
+
+
+class UserStatsTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create(username='Test-user')
+        self.user = User.objects.create(username='Test-user-2')
+
+    def test_stats_are_counted_on_first_read(self):
+        Post.objects.create(text='Текст', author=self.author)
+        Follow.objects.create(user=self.user, author=self.author)
+        stats = UserStats.objects.for_user(self.author)
+        self.assertEqual(stats.posts_count, 1)
+        self.assertEqual(stats.followers_count, 1)
+        self.assertEqual(stats.following_count, 0)
+
+    def test_stats_follow_creates_and_deletes(self):
+        author_stats = UserStats.objects.for_user(self.author)
+        user_stats = UserStats.objects.for_user(self.user)
+        with run_on_commit():
+            post = Post.objects.create(text='Текст', author=self.author)
+            Comment.objects.create(post=post, author=self.user, text='Текст')
+            follow = Follow.objects.create(user=self.user, author=self.author)
+        author_stats.refresh_from_db()
+        user_stats.refresh_from_db()
+        self.assertEqual(author_stats.posts_count, 1)
+        self.assertEqual(author_stats.followers_count, 1)
+        self.assertEqual(user_stats.comments_count, 1)
+        self.assertEqual(user_stats.following_count, 1)
+        with run_on_commit():
+            follow.delete()
+            post.delete()
+        author_stats.refresh_from_db()
+        user_stats.refresh_from_db()
+        self.assertEqual(author_stats.posts_count, 0)
+        self.assertEqual(author_stats.followers_count, 0)
+        self.assertEqual(user_stats.comments_count, 0)
+        self.assertEqual(user_stats.following_count, 0)
+
+    def test_recount_stats_repairs_drift(self):
+        Post.objects.create(text='Текст', author=self.author)
+        UserStats.objects.for_user(self.author)
+        UserStats.objects.filter(user=self.author).update(posts_count=42)
+        call_command('recount_stats', stdout=StringIO())
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 1)
+
+    def test_profile_renders_counters_without_counting(self):
+        Post.objects.create(text='Текст', author=self.author)
+        UserStats.objects.for_user(self.author)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(
+                'profile', kwargs={'username': self.author.username}))
+        self.assertContains(response, 'Записей: 1')
+        for query in queries.captured_queries:
+            self.assertFalse(query['sql'].startswith('SELECT COUNT('))
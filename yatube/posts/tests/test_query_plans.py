@@ -0,0 +1,102 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from posts.models import Comment, Follow, Group, Post, User
+from posts.paginator import FORWARD, encode_cursor
+from yatube.settings import PAGE_SIZE
+
+
+def query_plan(sql):
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def bad_plan_steps(plan):
+    """Шаги плана с полным перебором таблицы или сортировкой во временном
+    B-дереве."""
+    return [
+        step for step in plan
+        if 'TEMP B-TREE' in step
+        or (step.startswith('SCAN') and 'INDEX' not in step)
+    ]
+
+
+class QueryPlanTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='Test-user')
+        cls.user = User.objects.create_user(username='Test-user-2')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            slug='test-slug',
+            description='Тестовое описание'
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+        for i in range(PAGE_SIZE * 2 + 3):
+            post = Post.objects.create(
+                text=f'Тестовый текст {i}',
+                author=cls.author,
+                group=cls.group)
+            comment = Comment.objects.create(
+                post=post, author=cls.user, text='Комментарий')
+        cls.post = post
+        cls.comment = comment
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(QueryPlanTest.user)
+
+    def captured_selects(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authorized_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT')
+        ]
+
+    def test_views_use_indexes(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN есть только в SQLite')
+        urls = (
+            reverse('index'),
+            reverse('group_posts', kwargs={
+                'slug': QueryPlanTest.group.slug}),
+            reverse('profile', kwargs={
+                'username': QueryPlanTest.author.username}),
+            reverse('post', kwargs={
+                'username': QueryPlanTest.author.username,
+                'post_id': QueryPlanTest.post.pk}),
+            reverse('follow_index'),
+            reverse('post_comments', kwargs={
+                'username': QueryPlanTest.author.username,
+                'post_id': QueryPlanTest.post.pk,
+            }) + '?cursor=' + encode_cursor(
+                FORWARD, QueryPlanTest.comment.created,
+                QueryPlanTest.comment.pk),
+        )
+        cursor_urls = []
+        for url in urls:
+            page = self.authorized_client.get(url).context.get('page')
+            if page is None:
+                continue
+            second_url = url + f'?cursor={page.next_cursor}'
+            second = self.authorized_client.get(second_url).context['page']
+            third_url = url + f'?cursor={second.next_cursor}'
+            third = self.authorized_client.get(third_url).context['page']
+            cursor_urls += [
+                second_url,
+                third_url,
+                url + f'?cursor={third.previous_cursor}',
+            ]
+        for url in urls + tuple(cursor_urls):
+            for sql in self.captured_selects(url):
+                with self.subTest(url=url, sql=sql):
+                    plan = query_plan(sql)
+                    self.assertEqual(bad_plan_steps(plan), [], plan)
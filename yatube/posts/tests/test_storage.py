@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from posts import jobs
+from posts.models import Blob, Post, User
+from posts.storage import is_blob
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x01\x00'
+    b'\x01\x00\x00\x00\x00\x21\xf9\x04'
+    b'\x01\x0a\x00\x01\x00\x2c\x00\x00'
+    b'\x00\x00\x01\x00\x01\x00\x00\x02'
+    b'\x02\x4c\x01\x00\x3b'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, TASKS_BACKEND='sync',
+                   THUMBNAIL_PREGENERATE=False)
+class BlobStorageTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create(username='author')
+
+    def create_post(self, name='small.gif', content=SMALL_GIF):
+        return Post.objects.create(
+            text='Фото', author=self.user,
+            image=SimpleUploadedFile(name, content, 'image/gif'))
+
+    def test_same_content_is_stored_once(self):
+        first = self.create_post('one.gif')
+        second = self.create_post('two.GIF')
+        self.assertTrue(is_blob(first.image.name))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(first.image.storage.exists(first.image.name))
+        self.assertEqual(Blob.objects.get(name=first.image.name).refs, 2)
+
+    def test_file_is_deleted_with_last_post(self):
+        first, second = self.create_post(), self.create_post()
+        name = first.image.name
+        storage = first.image.storage
+        first.delete()
+        jobs.delete_blob(name)
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(Blob.objects.get(name=name).refs, 1)
+        second.delete()
+        jobs.delete_blob(name)
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(Blob.objects.filter(name=name).exists())
+
+    def test_replacing_image_releases_old_file(self):
+        post = self.create_post()
+        old = post.image.name
+        post.image = SimpleUploadedFile(
+            'new.gif', SMALL_GIF + b'\x00', 'image/gif')
+        post.save()
+        self.assertNotEqual(post.image.name, old)
+        self.assertEqual(Blob.objects.get(name=old).refs, 0)
+        self.assertEqual(Blob.objects.get(name=post.image.name).refs, 1)
+
+    def test_reuploading_same_content_keeps_one_reference(self):
+        post = self.create_post()
+        post.image = SimpleUploadedFile('again.gif', SMALL_GIF, 'image/gif')
+        post.save()
+        self.assertEqual(Blob.objects.get(name=post.image.name).refs, 1)
+
+    def test_imported_posts_keep_file_alive(self):
+        post = self.create_post()
+        name = post.image.name
+        out = StringIO()
+        call_command('export_posts', stdout=out)
+        with tempfile.NamedTemporaryFile(
+                'w', suffix='.jsonl', delete=False, encoding='utf-8') as file:
+            file.write(out.getvalue())
+        self.addCleanup(os.remove, file.name)
+        call_command('import_posts', file.name, stdout=StringIO())
+        self.assertEqual(Blob.objects.get(name=name).refs, 2)
+        post.delete()
+        jobs.delete_blob(name)
+        self.assertTrue(post.image.storage.exists(name))
+        self.assertEqual(Post.objects.get().image.name, name)
+
+    def test_assigning_stored_name_takes_reference(self):
+        post = self.create_post()
+        copy = Post.objects.create(
+            text='Копия', author=self.user, image=post.image.name)
+        self.assertEqual(Blob.objects.get(name=copy.image.name).refs, 2)
+
+    def test_legacy_files_are_not_tracked(self):
+        post = Post.objects.create(
+            text='Старое фото', author=self.user, image='posts/old.gif')
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(Blob.objects.release(post.image.name))
@@ -0,0 +1,201 @@
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from posts import jobs, search, tasks
+from posts.models import Follow, Post, Task, TimelineEntry, User, UserStats
+from posts.tests.utils import run_on_commit
+
+calls = []
+finished = threading.Event()
+
+
+@tasks.task
+def flaky(fail_times):
+    calls.append(fail_times)
+    if len(calls) <= fail_times:
+        raise RuntimeError('Сбой')
+    finished.set()
+
+
+@tasks.task
+def append_pid(path, fail_times):
+    with open(path, 'a') as file:
+        print(os.getpid(), file=file)
+    with open(path) as file:
+        if len(file.readlines()) <= fail_times:
+            raise RuntimeError('Сбой')
+
+
+in_transaction = []
+
+
+@tasks.task
+def inside_transaction():
+    in_transaction.append(connection.in_atomic_block)
+
+
+@tasks.task(atomic=False)
+def outside_transaction():
+    in_transaction.append(connection.in_atomic_block)
+
+
+@override_settings(TASKS_BACKEND='db')
+class TableQueueTest(TestCase):
+    def setUp(self):
+        calls.clear()
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=self.reader, author=self.author)
+        tasks.run_pending()
+        self.client.force_login(self.author)
+
+    def test_new_post_defers_side_effects(self):
+        stats = UserStats.objects.for_user(self.author)
+        self.client.post(reverse('new_post'), {'text': 'Ёжик в тумане'})
+        post = Post.objects.get()
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        self.assertEqual(set(Task.objects.values_list('name', flat=True)), {
+            'posts.jobs.bump_stats', 'posts.jobs.fan_out',
+            'posts.jobs.index_post'})
+
+        self.assertEqual(tasks.run_pending(), (3, 0))
+        self.assertFalse(Task.objects.exists())
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post).exists())
+        stats.refresh_from_db()
+        self.assertEqual(stats.posts_count, 1)
+        self.assertEqual(list(search.SearchResults('ёжик')), [post])
+
+    def test_comment_defers_counter(self):
+        post = Post.objects.create(text='Пост', author=self.author)
+        tasks.run_pending()
+        stats = UserStats.objects.for_user(self.reader)
+        self.client.force_login(self.reader)
+        self.client.post(
+            reverse('add_comment', args=['author', post.pk]),
+            {'text': 'Комментарий'})
+        self.assertEqual(post.comments.count(), 1)
+        stats.refresh_from_db()
+        self.assertEqual(stats.comments_count, 0)
+        tasks.run_pending()
+        stats.refresh_from_db()
+        self.assertEqual(stats.comments_count, 1)
+
+    @override_settings(TASKS_MAX_ATTEMPTS=2, TASKS_RETRY_DELAY=60)
+    def test_retry_with_backoff(self):
+        flaky.delay(5)
+        started = timezone.now()
+        self.assertEqual(tasks.run_pending(), (0, 1))
+        job = Task.objects.get()
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNone(job.locked_until)
+        self.assertIn('Сбой', job.last_error)
+        self.assertGreaterEqual(job.run_at, started + timedelta(seconds=30))
+        # Задача ждёт своего времени
+        self.assertEqual(tasks.run_pending(), (0, 0))
+
+        Task.objects.update(run_at=timezone.now())
+        self.assertEqual(tasks.run_pending(), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, 2)
+        self.assertTrue(job.failed)
+        Task.objects.update(run_at=timezone.now())
+        self.assertEqual(tasks.run_pending(), (0, 0))
+        self.assertEqual(len(calls), 2)
+
+    def test_lost_lease_rolls_back_task(self):
+        stats = UserStats.objects.for_user(self.author)
+        jobs.bump_stats.delay(self.author.pk, posts_count=1)
+        job, = tasks.claim(1)
+        # Аренда истекла, и задачу забрал другой воркер
+        Task.objects.update(
+            locked_until=timezone.now() + timedelta(minutes=5))
+        with self.assertLogs('posts.tasks', 'WARNING'):
+            self.assertFalse(tasks.execute(job))
+        stats.refresh_from_db()
+        self.assertEqual(stats.posts_count, 0)
+        self.assertTrue(Task.objects.exists())
+
+    def test_locked_task_is_skipped(self):
+        flaky.delay(0)
+        Task.objects.update(
+            locked_until=timezone.now() + timedelta(minutes=1))
+        self.assertEqual(tasks.run_pending(), (0, 0))
+        Task.objects.update(
+            locked_until=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(tasks.run_pending(), (1, 0))
+
+    def test_worker_command(self):
+        flaky.delay(0)
+        out = StringIO()
+        call_command('run_tasks', '--once', stdout=out)
+        self.assertIn('Выполнено: 1', out.getvalue())
+        self.assertFalse(Task.objects.exists())
+
+
+class SyncBackendTest(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_runs_after_commit_and_logs_errors(self):
+        with self.assertLogs('posts.tasks', 'ERROR'), run_on_commit():
+            flaky.delay(1)
+            self.assertEqual(calls, [])
+        self.assertEqual(calls, [1])
+        self.assertFalse(Task.objects.exists())
+
+
+@override_settings(TASKS_BACKEND='thread', TASKS_RETRY_DELAY=0)
+class ThreadBackendTest(TransactionTestCase):
+    def setUp(self):
+        calls.clear()
+        finished.clear()
+
+    def test_runs_in_pool_with_retries(self):
+        with self.assertLogs('posts.tasks', 'WARNING'):
+            flaky.delay(2)
+            self.assertTrue(finished.wait(5))
+        self.assertEqual(calls, [2, 2, 2])
+
+    def test_non_atomic_task_runs_outside_transaction(self):
+        in_transaction.clear()
+        tasks.run_in_pool(inside_transaction.task_name, (), {})
+        tasks.run_in_pool(outside_transaction.task_name, (), {})
+        self.assertEqual(in_transaction, [True, False])
+
+
+@override_settings(TASKS_BACKEND='process', TASKS_RETRY_DELAY=0)
+class ProcessBackendTest(TransactionTestCase):
+    def setUp(self):
+        file = tempfile.NamedTemporaryFile(dir=settings.BASE_DIR, delete=False)
+        file.close()
+        self.path = file.name
+        self.addCleanup(os.remove, self.path)
+        self.addCleanup(lambda: tasks._executors.pop('process').shutdown())
+
+    def read_pids(self, count, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with open(self.path) as file:
+                pids = file.read().split()
+            if len(pids) >= count:
+                return pids
+            time.sleep(0.1)
+        self.fail(f'Задача не выполнилась {count} раз за {timeout} с')
+
+    def test_runs_in_other_process_with_retries(self):
+        with self.assertLogs('posts.tasks', 'WARNING') as logs:
+            append_pid.delay(self.path, 2)
+            pids = self.read_pids(3)
+        self.assertEqual(len(logs.records), 2)
+        self.assertNotIn(str(os.getpid()), pids)
@@ -0,0 +1,143 @@
+import io
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from posts import thumbnails
+from posts.models import Post, User
+from posts.tests.utils import run_on_commit
+from sorl.thumbnail import default
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def make_image(size):
+    file = io.BytesIO()
+    Image.new('RGB', size, 'red').save(file, 'JPEG')
+    return file.getvalue()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, TASKS_BACKEND='sync')
+class ThumbnailsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='Test-user')
+        small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x01\x00'
+            b'\x01\x00\x00\x00\x00\x21\xf9\x04'
+            b'\x01\x0a\x00\x01\x00\x2c\x00\x00'
+            b'\x00\x00\x01\x00\x01\x00\x00\x02'
+            b'\x02\x4c\x01\x00\x3b'
+        )
+        cls.post = Post.objects.create(
+            text='Тестовый текст',
+            author=cls.author,
+            image=SimpleUploadedFile(
+                name='small.gif', content=small_gif, content_type='image/gif')
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse(
+            'profile', kwargs={'username': ThumbnailsTest.author.username})
+
+    def test_feed_shows_original_until_thumbnail_is_ready(self):
+        post = ThumbnailsTest.post
+        self.assertIsNone(thumbnails.cached_srcset(post.image.name, 'card'))
+        response = self.client.get(self.url)
+        self.assertContains(response, post.image.url)
+
+    def test_feed_never_generates_thumbnails_inline(self):
+        with mock.patch.object(thumbnails, 'generate') as generate:
+            with run_on_commit():
+                self.client.get(self.url)
+        generate.assert_not_called()
+
+    @override_settings(TASKS_BACKEND='thread')
+    def test_feed_schedules_missing_thumbnails(self):
+        with mock.patch(
+                'posts.templatetags.post_images.schedule') as schedule:
+            self.client.get(self.url)
+        schedule.assert_called_once_with(ThumbnailsTest.post)
+
+    def test_feed_shows_pregenerated_thumbnail(self):
+        post = ThumbnailsTest.post
+        thumbnails.run_job(post.pk, post.image.name)
+        srcset = thumbnails.cached_srcset(post.image.name, 'card')
+        self.assertIsNotNone(srcset)
+        response = self.client.get(self.url)
+        self.assertContains(response, f'src="{srcset["src"]}"')
+        self.assertNotContains(response, f'src="{post.image.url}"')
+
+    def test_srcset_is_cached_after_generation(self):
+        post = Post.objects.create(
+            text='Большое фото', author=ThumbnailsTest.author,
+            image=SimpleUploadedFile(
+                'wide.jpg', make_image((1000, 500)), 'image/jpeg'))
+        self.assertIsNone(thumbnails.cached_srcset(post.image.name, 'card'))
+        thumbnails.run_job(post.pk, post.image.name)
+        srcset = thumbnails.cached_srcset(post.image.name, 'card')
+        self.assertEqual((srcset['width'], srcset['height']), (960, 339))
+        self.assertEqual(
+            [candidate.split()[1] for candidate in srcset['srcset'].split(
+                ', ')],
+            ['360w', '720w', '960w'])
+        self.assertEqual(srcset['sources'][0]['type'], 'image/webp')
+        self.assertIn('.webp 360w', srcset['sources'][0]['srcset'])
+
+    def test_feed_renders_picture_without_thumbnail_lookups(self):
+        post = ThumbnailsTest.post
+        thumbnails.run_job(post.pk, post.image.name)
+        srcset = thumbnails.cached_srcset(post.image.name, 'card')
+        with mock.patch.object(default.kvstore, 'get') as kvstore_get:
+            response = self.client.get(self.url)
+        kvstore_get.assert_not_called()
+        self.assertContains(response, f'srcset="{srcset["srcset"]}"')
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertContains(response, 'loading="lazy" decoding="async"')
+        self.assertContains(response, 'width="960" height="339"')
+
+    def test_delete_forgets_srcset(self):
+        post = ThumbnailsTest.post
+        thumbnails.run_job(post.pk, post.image.name)
+        thumbnails.delete(post.image.name)
+        self.assertIsNone(thumbnails.cached_srcset(post.image.name, 'card'))
+
+    def test_source_is_opened_once_per_srcset(self):
+        post = ThumbnailsTest.post
+        with mock.patch.object(
+                thumbnails, 'source_width',
+                wraps=thumbnails.source_width) as source_width:
+            thumbnails.run_job(post.pk, post.image.name)
+        self.assertEqual(source_width.call_count, 1)
+
+    def test_sizes_follow_column(self):
+        self.assertEqual(
+            thumbnails.sizes(),
+            '(min-width: 1200px) 1110px, (min-width: 992px) 930px, '
+            '(min-width: 768px) 690px, (min-width: 576px) 510px, 100vw')
+        # col-md-9 от md и шире, ниже - на всю ширину
+        self.assertEqual(
+            thumbnails.sizes('col-md-9'),
+            '(min-width: 1200px) 803px, (min-width: 992px) 668px, '
+            '(min-width: 768px) 488px, (min-width: 576px) 510px, 100vw')
+        post = ThumbnailsTest.post
+        thumbnails.run_job(post.pk, post.image.name)
+        self.assertContains(
+            self.client.get(self.url),
+            f'sizes="{thumbnails.sizes("col-md-9")}"')
+        self.assertContains(
+            self.client.get(reverse('index')),
+            f'sizes="{thumbnails.sizes()}"')
@@ -1,5 +1,6 @@
 from django.core.cache import cache
 from django.test import Client, TestCase
+from django.urls import resolve, reverse
 from posts.models import Comment, Follow, Group, Post, User
 
 
@@ -133,3 +134,10 @@ class URLTests(TestCase):
     def test_follow_page_redirect_anonymous(self):
         response = self.guest_client.get('/follow/')
         self.assertEqual(response.status_code, 302)
+
+    def test_service_urls_do_not_shadow_user_pages(self):
+        for username in ('export', 'staff'):
+            for name in ('profile_follow', 'profile_unfollow'):
+                with self.subTest(username=username, name=name):
+                    url = reverse(name, kwargs={'username': username})
+                    self.assertEqual(resolve(url).url_name, name)
@@ -1,14 +1,26 @@
 import shutil
 import tempfile
+import time
 from datetime import datetime as dt
+from io import StringIO
 
 from django import forms
 from django.conf import settings
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import (Client, RequestFactory, TestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from posts.models import Follow, Group, Post, User
+from django.utils.http import http_date
+from posts.models import (Comment, Follow, Group, Post, TimelineEntry, User,
+                          UserStats)
+from posts.caching import (FEED_VERSION_KEY, bump_version, feed_body_key,
+                           get_versions, post_version_key)
+from posts.paginator import FORWARD, CursorPaginator, encode_cursor
+from posts.tests.utils import run_on_commit
 from yatube.settings import PAGE_SIZE
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -185,19 +197,71 @@ class ViewsTest(TestCase):
         self.assertNotEqual(last_post, new_post)
 
     def test_home_page_cache(self):
-        new_post = Post.objects.create(
-            text='New test text',
-            author=ViewsTest.author,
-            group=ViewsTest.group
-        )
         self.guest_client.get(reverse('index'))
-        new_post.delete()
+        Post.objects.filter(pk=ViewsTest.post.pk).update(text='Без сигнала')
         response = self.guest_client.get(reverse('index'))
-        self.assertIn(new_post.text, str(response.content))
-        cache.clear()
+        self.assertNotIn('page', response.context)
+        self.assertContains(response, 'Тестовый текст')
+
+    def test_home_page_cache_invalidated_by_new_and_deleted_post(self):
+        self.guest_client.get(reverse('index'))
+        with run_on_commit():
+            new_post = Post.objects.create(
+                text='New test text',
+                author=ViewsTest.author,
+                group=ViewsTest.group
+            )
         response = self.guest_client.get(reverse('index'))
-        last_post = response.context['page'].object_list[0]
-        self.assertNotEqual(last_post, new_post)
+        self.assertEqual(response.context['page'].object_list[0], new_post)
+        with run_on_commit():
+            new_post.delete()
+        response = self.guest_client.get(reverse('index'))
+        self.assertNotContains(response, 'New test text')
+
+    def test_home_page_cache_keeps_user_chrome(self):
+        self.guest_client.get(reverse('index'))
+        response = self.authorized_client.get(reverse('index'))
+        self.assertContains(response, self.user.username)
+
+    @override_settings(FEED_CACHE_TIMEOUT=0)
+    def test_home_page_serves_stale_while_revalidating(self):
+        self.guest_client.get(reverse('index'))
+        key, _ = feed_body_key(RequestFactory().get(reverse('index')))
+        cache.set(key + ':lock', True)
+        response = self.guest_client.get(reverse('index'))
+        self.assertNotIn('page', response.context)
+        cache.delete(key + ':lock')
+        response = self.guest_client.get(reverse('index'))
+        self.assertIn('page', response.context)
+
+    def test_home_page_serves_last_body_across_versions(self):
+        self.guest_client.get(reverse('index'))
+        key, _ = feed_body_key(RequestFactory().get(reverse('index')))
+        with run_on_commit():
+            Post.objects.create(text='Новый пост', author=ViewsTest.author)
+        # Пока один запрос перерисовывает ленту, остальным - прошлое тело
+        cache.set(key + ':lock', True)
+        response = self.guest_client.get(reverse('index'))
+        self.assertNotIn('page', response.context)
+        self.assertNotContains(response, 'Новый пост')
+        self.assertIn('no-store', response['Cache-Control'])
+        cache.delete(key + ':lock')
+        response = self.guest_client.get(reverse('index'))
+        self.assertContains(response, 'Новый пост')
+        self.assertNotIn('no-store', response['Cache-Control'])
+
+    def test_home_page_cache_key_ignores_junk_parameters(self):
+        factory = RequestFactory()
+        url = reverse('index')
+        self.assertIsNone(feed_body_key(factory.get(url, {'utm': 'x'})))
+        self.assertIsNone(feed_body_key(factory.get(url, {'page': '2'})))
+        first, _ = feed_body_key(factory.get(url))
+        broken, _ = feed_body_key(factory.get(url, {'cursor': 'мусор'}))
+        self.assertEqual(first, broken)
+        cursor = encode_cursor(
+            FORWARD, ViewsTest.post.pub_date, ViewsTest.post.pk)
+        key, _ = feed_body_key(factory.get(url, {'cursor': cursor}))
+        self.assertNotEqual(key, first)
 
     def test_authorized_client_profile_follow(self):
         self.authorized_client.get(reverse(
@@ -218,9 +282,10 @@ class ViewsTest(TestCase):
         Follow.objects.create(
             user=self.user,
             author=ViewsTest.author)
-        new_post = Post.objects.create(
-            text='Новый тестовый текст',
-            author=ViewsTest.author)
+        with run_on_commit():
+            new_post = Post.objects.create(
+                text='Новый тестовый текст',
+                author=ViewsTest.author)
         response = self.authorized_client.get(reverse('follow_index'))
         last_post = response.context['page'].object_list[0]
         self.assertEqual(last_post, new_post)
@@ -230,8 +295,7 @@ class ViewsTest(TestCase):
             text='Новый тестовый текст',
             author=ViewsTest.author)
         response = self.authorized_client.get(reverse('follow_index'))
-        last_post = response.context['page'].object_list.first
-        self.assertNotEqual(last_post, new_post)
+        self.assertNotIn(new_post, response.context['page'].object_list)
 
 
 class PaginationTest(TestCase):
@@ -287,3 +351,573 @@ class PaginationTest(TestCase):
             'profile',
             kwargs={'username': PaginationTest.author.username}) + '?page=2')
         self.assertEqual(len(response.context['page'].object_list), 3)
+
+
+class CursorPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='Test-user')
+        for i in range(0, PAGE_SIZE * 2 + 3):
+            Post.objects.create(text=f'Тестовый текст {i}', author=cls.author)
+
+    def setUp(self):
+        self.guest_client = Client()
+        self.url = reverse(
+            'profile', kwargs={'username': CursorPaginationTest.author})
+
+    def test_first_page_is_keyset(self):
+        response = self.guest_client.get(self.url)
+        page = response.context['page']
+        self.assertTrue(page.is_keyset)
+        self.assertEqual(len(page.object_list), PAGE_SIZE)
+        self.assertIsNone(page.previous_cursor)
+        self.assertIsNotNone(page.next_cursor)
+
+    def test_cursor_walks_whole_feed(self):
+        expected = list(Post.objects.order_by('-pub_date', '-pk'))
+        seen = []
+        url = self.url
+        while url:
+            page = self.guest_client.get(url).context['page']
+            seen.extend(page.object_list)
+            url = (self.url + f'?cursor={page.next_cursor}'
+                   if page.next_cursor else None)
+        self.assertEqual(seen, expected)
+
+    def test_previous_cursor_returns_previous_page(self):
+        first = self.guest_client.get(self.url).context['page']
+        second = self.guest_client.get(
+            self.url + f'?cursor={first.next_cursor}'
+        ).context['page']
+        third = self.guest_client.get(
+            self.url + f'?cursor={second.next_cursor}'
+        ).context['page']
+        self.assertEqual(len(third.object_list), 3)
+        self.assertIsNone(third.next_cursor)
+        back = self.guest_client.get(
+            self.url + f'?cursor={third.previous_cursor}'
+        ).context['page']
+        self.assertEqual(list(back.object_list), list(second.object_list))
+        self.assertIsNotNone(back.previous_cursor)
+
+    def test_deep_page_does_not_count(self):
+        paginator = CursorPaginator(Post.objects.all(), PAGE_SIZE)
+        first = paginator.get_cursor_page()
+        with self.assertNumQueries(2) as queries:
+            page = paginator.get_cursor_page(first.next_cursor)
+            list(page.object_list)
+        for query in queries.captured_queries:
+            self.assertNotIn('COUNT(', query['sql'].upper())
+
+    def test_keyset_pages_have_numbers(self):
+        first = self.guest_client.get(self.url).context['page']
+        self.assertEqual(first.number, 1)
+        self.assertTrue(first.has_other_pages())
+        self.assertFalse(first.has_previous())
+        second = self.guest_client.get(
+            self.url + f'?cursor={first.next_cursor}').context['page']
+        self.assertEqual(second.number, 2)
+        self.assertEqual(
+            (second.previous_page_number(), second.next_page_number()),
+            (1, 3))
+        third = self.guest_client.get(
+            self.url + f'?cursor={second.next_cursor}').context['page']
+        self.assertEqual(third.number, 3)
+        self.assertFalse(third.has_next())
+        back = self.guest_client.get(
+            self.url + f'?cursor={third.previous_cursor}').context['page']
+        self.assertEqual(back.number, 2)
+
+    def test_cursor_links_keep_other_parameters(self):
+        response = self.guest_client.get(self.url, {'lang': 'ru'})
+        page = response.context['page']
+        self.assertContains(
+            response, f'href="?lang=ru&amp;cursor={page.next_cursor}"')
+        response = self.guest_client.get(
+            self.url, {'lang': 'ru', 'cursor': page.next_cursor})
+        self.assertContains(
+            response, 'href="?lang=ru&amp;cursor='
+            f'{response.context["page"].previous_cursor}"')
+
+    def test_broken_cursor_falls_back_to_first_page(self):
+        response = self.guest_client.get(self.url + '?cursor=abc')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context['page'].previous_cursor)
+
+
+class FeedQueriesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='Test-user')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            slug='test-slug',
+            description='Тестовое описание'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='Test-user-2')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        Follow.objects.create(user=self.user, author=FeedQueriesTest.author)
+
+    def create_posts(self, count):
+        with run_on_commit():
+            for i in range(count):
+                post = Post.objects.create(
+                    text=f'Тестовый текст {i}',
+                    author=FeedQueriesTest.author,
+                    group=FeedQueriesTest.group)
+                Comment.objects.create(
+                    post=post, author=self.user, text='Комментарий')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.authorized_client.get(url)
+        return len(queries)
+
+    def test_feed_queries_do_not_grow_with_page_size(self):
+        urls = (
+            reverse('index'),
+            reverse('group_posts', kwargs={
+                'slug': FeedQueriesTest.group.slug}),
+            reverse('profile', kwargs={
+                'username': FeedQueriesTest.author.username}),
+            reverse('follow_index'),
+        )
+        self.create_posts(1)
+        for url in urls:
+            self.authorized_client.get(url)
+        cache.clear()
+        few = {url: self.count_queries(url) for url in urls}
+        cache.clear()
+        self.create_posts(PAGE_SIZE)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), few[url])
+
+    def test_feed_shows_comment_count(self):
+        self.create_posts(1)
+        response = self.authorized_client.get(reverse('follow_index'))
+        post = response.context['page'].object_list[0]
+        self.assertEqual(post.comment_count, 1)
+        self.assertContains(response, 'Комментариев: 1')
+
+
+class TimelineTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create(username='Test-user')
+        self.celebrity = User.objects.create(username='Celebrity')
+        self.user = User.objects.create_user(username='Test-user-2')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def feed(self):
+        response = self.authorized_client.get(reverse('follow_index'))
+        return list(response.context['page'].object_list)
+
+    def test_new_post_fans_out_to_followers(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        with run_on_commit():
+            post = Post.objects.create(text='Текст', author=self.author)
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.user, post=post).exists())
+        self.assertEqual(self.feed(), [post])
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        post = Post.objects.create(text='Текст', author=self.author)
+        with run_on_commit():
+            self.authorized_client.get(reverse(
+                'profile_follow', kwargs={'username': self.author.username}))
+        self.assertEqual(self.feed(), [post])
+        self.authorized_client.get(reverse(
+            'profile_unfollow', kwargs={'username': self.author.username}))
+        self.assertFalse(TimelineEntry.objects.filter(user=self.user).exists())
+        self.assertEqual(self.feed(), [])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_celebrity_posts_are_merged_on_read(self):
+        fan = User.objects.create(username='Fan')
+        Follow.objects.create(user=fan, author=self.celebrity)
+        Follow.objects.create(user=self.user, author=self.celebrity)
+        Follow.objects.create(user=self.user, author=self.author)
+        with run_on_commit():
+            posts = [
+                Post.objects.create(text='Текст', author=author)
+                for author in (self.author, self.celebrity, self.author)
+            ]
+        self.assertFalse(
+            TimelineEntry.objects.filter(post__author=self.celebrity).exists())
+        self.assertEqual(self.feed(), posts[::-1])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_former_celebrity_posts_stay_in_feed(self):
+        fan = User.objects.create(username='Fan')
+        with run_on_commit():
+            fan_follow = Follow.objects.create(user=fan, author=self.celebrity)
+            Follow.objects.create(user=self.user, author=self.celebrity)
+            post = Post.objects.create(text='Текст', author=self.celebrity)
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        with run_on_commit():
+            fan_follow.delete()
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.user, post=post).exists())
+        self.assertEqual(self.feed(), [post])
+
+
+class PostCardCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='Test-user')
+        self.group = Group.objects.create(
+            title='Тестовый заголовок',
+            slug='test-slug',
+            description='Тестовое описание'
+        )
+        self.post = Post.objects.create(
+            text='Старый текст', author=self.author, group=self.group)
+        self.url = reverse('group_posts', kwargs={'slug': self.group.slug})
+
+    def test_card_is_cached_between_feeds(self):
+        self.client.get(self.url)
+        Post.objects.filter(pk=self.post.pk).update(text='Без сигнала')
+        # Лента с той же шириной колонки берёт ту же карточку
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Старый текст')
+
+    def test_post_edit_invalidates_card(self):
+        self.client.get(self.url)
+        self.post.text = 'Новый текст'
+        with run_on_commit():
+            self.post.save()
+        self.assertContains(self.client.get(self.url), 'Новый текст')
+
+    def test_comment_invalidates_card(self):
+        self.client.get(self.url)
+        with run_on_commit():
+            Comment.objects.create(
+                post=self.post, author=self.author, text='Комментарий')
+        self.assertContains(self.client.get(self.url), 'Комментариев: 1')
+
+    def test_group_edit_invalidates_card(self):
+        self.client.get(self.url)
+        self.group.title = 'Новый заголовок'
+        with run_on_commit():
+            self.group.save()
+        self.assertContains(self.client.get(self.url), '#Новый заголовок')
+
+    def test_author_sees_edit_link(self):
+        self.client.get(self.url)
+        self.client.force_login(self.author)
+        self.assertContains(self.client.get(self.url), 'Редактировать')
+
+
+class VersionBumpTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='Test-user')
+
+    def test_versions_change_after_commit(self):
+        post = Post.objects.create(text='Текст', author=self.author)
+        keys = [FEED_VERSION_KEY, post_version_key(post.pk)]
+        before = get_versions(keys)
+        with transaction.atomic():
+            bump_version(FEED_VERSION_KEY)
+            post.text = 'Новый текст'
+            post.save()
+            self.assertEqual(get_versions(keys), before)
+        after = get_versions(keys)
+        self.assertNotEqual(after[0], before[0])
+        self.assertNotEqual(after[1], before[1])
+
+    def test_rollback_keeps_versions(self):
+        before = get_versions([FEED_VERSION_KEY])
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Post.objects.create(text='Текст', author=self.author)
+            raise RuntimeError
+        self.assertEqual(get_versions([FEED_VERSION_KEY]), before)
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        with run_on_commit():
+            self.post = Post.objects.create(
+                text='Ёжик в тумане ищет лошадку', author=self.author)
+            Post.objects.create(
+                text='Лошадка и ёжик, ёжик и лошадка', author=self.author)
+            Post.objects.create(text='Про котов', author=self.author)
+        self.url = reverse('search')
+
+    def search(self, query, **params):
+        return self.client.get(self.url, {'q': query, **params})
+
+    def test_ranked_results(self):
+        page = self.search('ёжик лошад').context['page']
+        self.assertEqual(page.paginator.count, 2)
+        self.assertEqual(
+            page.object_list[0].text, 'Лошадка и ёжик, ёжик и лошадка')
+
+    def test_prefix_and_operators_are_safe(self):
+        self.assertEqual(
+            self.search('тума').context['page'].paginator.count, 1)
+        response = self.search('"ёжик" OR NEAR(')
+        self.assertEqual(response.status_code, 200)
+
+    def test_index_follows_edits_and_deletes(self):
+        self.post.text = 'Теперь про собак'
+        with run_on_commit():
+            self.post.save()
+        self.assertEqual(
+            self.search('тумане').context['page'].paginator.count, 0)
+        self.assertEqual(
+            self.search('собак').context['page'].paginator.count, 1)
+        with run_on_commit():
+            self.post.delete()
+        self.assertEqual(
+            self.search('собак').context['page'].paginator.count, 0)
+
+    def test_pagination_keeps_query(self):
+        Post.objects.bulk_create(
+            Post(text=f'Ёжик номер {i}', author=self.author)
+            for i in range(PAGE_SIZE))
+        call_command('rebuild_search_index', stdout=StringIO())
+        response = self.search('ёжик')
+        self.assertEqual(
+            response.context['page'].paginator.count, PAGE_SIZE + 2)
+        self.assertContains(response, '?q=%D1%91%D0%B6%D0%B8%D0%BA&amp;page=2')
+        page = self.search('ёжик', page=2).context['page']
+        self.assertEqual(len(page.object_list), 2)
+
+    def test_empty_query(self):
+        page = self.search('').context['page']
+        self.assertEqual(page.paginator.count, 0)
+
+
+class CommentPaginationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.post = Post.objects.create(text='Популярный', author=self.author)
+        for number in range(7):
+            commenter = User.objects.create_user(username=f'reader{number}')
+            Comment.objects.create(
+                post=self.post, author=commenter, text=f'Комментарий {number}')
+        self.url = reverse('post', kwargs={
+            'username': self.author.username, 'post_id': self.post.pk})
+        self.fragment_url = reverse('post_comments', kwargs={
+            'username': self.author.username, 'post_id': self.post.pk})
+
+    def texts(self, response):
+        return [comment.text for comment in response.context['comments']]
+
+    def test_post_view_shows_first_comments(self):
+        with self.settings(COMMENTS_PAGE_SIZE=3):
+            response = self.client.get(self.url)
+        self.assertEqual(self.texts(response), [
+            'Комментарий 0', 'Комментарий 1', 'Комментарий 2'])
+        self.assertContains(response, 'Показать ещё комментарии')
+
+    def test_fragment_walks_all_comments(self):
+        with self.settings(COMMENTS_PAGE_SIZE=3):
+            cursor = self.client.get(self.url).context['comments_cursor']
+            seen = []
+            while cursor:
+                response = self.client.get(self.fragment_url,
+                                           {'cursor': cursor})
+                self.assertTemplateUsed(
+                    response, 'includes/comments_list.html')
+                seen += self.texts(response)
+                cursor = response.context['comments_cursor']
+        self.assertEqual(
+            seen, [f'Комментарий {number}' for number in range(3, 7)])
+
+    def test_comment_authors_are_joined(self):
+        with self.settings(COMMENTS_PAGE_SIZE=50):
+            self.client.get(self.url)
+            with CaptureQueriesContext(connection) as few:
+                self.client.get(self.url)
+            for number in range(10):
+                Comment.objects.create(
+                    post=self.post, author=User.objects.create_user(
+                        username=f'late{number}'), text='Ещё')
+            cache.clear()
+            self.client.get(self.url)
+            with CaptureQueriesContext(connection) as many:
+                self.client.get(self.url)
+        self.assertEqual(len(few), len(many))
+
+
+class FollowSubsystemTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='reader')
+        self.authors = [
+            User.objects.create_user(username=f'author{number}')
+            for number in range(3)]
+        for author in self.authors:
+            Post.objects.create(text=f'Пост {author.username}', author=author)
+        self.client.force_login(self.user)
+
+    def follow_url(self, author, action='profile_follow'):
+        return reverse(action, kwargs={'username': author.username})
+
+    def test_repeated_follow_and_unfollow_are_harmless(self):
+        author = self.authors[0]
+        for _ in range(2):
+            with run_on_commit():
+                response = self.client.get(self.follow_url(author))
+            self.assertRedirects(response, reverse('follow_index'))
+        self.assertEqual(Follow.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(
+            UserStats.objects.for_user(author).followers_count, 1)
+        for _ in range(2):
+            with run_on_commit():
+                response = self.client.get(
+                    self.follow_url(author, 'profile_unfollow'))
+            self.assertRedirects(response, reverse('index'))
+        self.assertFalse(Follow.objects.exists())
+        self.assertEqual(
+            UserStats.objects.for_user(author).followers_count, 0)
+        self.assertEqual(
+            UserStats.objects.for_user(self.user).following_count, 0)
+
+    def test_unknown_author_is_404(self):
+        response = self.client.get(
+            reverse('profile_follow', kwargs={'username': 'nobody'}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_counts_survive_signals_firing_twice(self):
+        # Два запроса на отписку прочитали одну и ту же строку
+        follow = Follow.objects.create(user=self.user, author=self.authors[0])
+        twin = Follow.objects.get(pk=follow.pk)
+        UserStats.objects.for_user(self.user)
+        with run_on_commit():
+            follow.delete()
+            twin.delete()
+        self.assertEqual(
+            UserStats.objects.for_user(self.user).following_count, 0)
+
+    def test_bulk_follow_and_unfollow(self):
+        url = reverse('follow_bulk')
+        usernames = [author.username for author in self.authors]
+        with run_on_commit():
+            response = self.client.post(
+                url, {'author': usernames + [self.user.username, 'nobody']})
+        self.assertEqual(response.json(), {'follow': 3})
+        self.assertEqual(TimelineEntry.objects.filter(
+            user=self.user).count(), 3)
+        self.assertEqual(
+            UserStats.objects.for_user(self.user).following_count, 3)
+        # Повторная подписка ничего не меняет
+        with run_on_commit():
+            self.client.post(url, {'author': usernames})
+        self.assertEqual(Follow.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(
+            UserStats.objects.for_user(self.user).following_count, 3)
+        with run_on_commit():
+            response = self.client.post(
+                url, {'author': usernames[:2], 'action': 'unfollow'})
+        self.assertEqual(response.json(), {'unfollow': 2})
+        self.assertEqual(
+            UserStats.objects.for_user(self.user).following_count, 1)
+        self.assertEqual(TimelineEntry.objects.filter(
+            user=self.user).count(), 1)
+        self.assertEqual(self.client.get(url).status_code, 405)
+
+    def test_unfollow_is_a_few_statements(self):
+        Follow.objects.create(user=self.user, author=self.authors[0])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(
+                self.follow_url(self.authors[0], 'profile_unfollow'))
+        deletes = [query['sql'] for query in queries.captured_queries
+                   if query['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 2, deletes)
+
+    def test_follow_leaves_counters_to_job(self):
+        UserStats.objects.for_user(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.follow_url(self.authors[0]))
+        # Ни проверки существующих подписок, ни пересчёта в запросе
+        extra = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith(('UPDATE', 'SELECT "posts_follow"'))]
+        self.assertEqual(extra, [])
+        self.assertTrue(Follow.objects.filter(user=self.user).exists())
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        self.post = Post.objects.create(
+            text='Текст', author=self.author, group=self.group)
+        self.urls = [
+            reverse('index'),
+            reverse('group_posts', kwargs={'slug': 'group'}),
+            reverse('profile', kwargs={'username': 'author'}),
+            reverse('post', kwargs={
+                'username': 'author', 'post_id': self.post.pk}),
+        ]
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_revalidation_skips_rendering(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.client.get(url)
+                response = self.client.get(url)
+                self.assertIn('no-cache', response['Cache-Control'])
+                self.assertNotIn('Last-Modified', response)
+                revalidated = self.revalidate(url, response)
+                self.assertEqual(revalidated.status_code, 304)
+                self.assertEqual(revalidated.templates, [])
+
+    def test_if_modified_since_does_not_hide_edits(self):
+        url = self.urls[3]
+        since = http_date(time.time() + 60)
+        self.post.text = 'Исправленный текст'
+        with run_on_commit():
+            self.post.save()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Исправленный текст')
+
+    def assert_changed(self, urls, change):
+        responses = {url: self.client.get(url) for url in urls}
+        with run_on_commit():
+            change()
+        for url, response in responses.items():
+            with self.subTest(url=url):
+                self.assertEqual(
+                    self.revalidate(url, response).status_code, 200)
+
+    def test_comment_and_edit_invalidate_pages(self):
+        self.assert_changed(self.urls, lambda: Comment.objects.create(
+            post=self.post, author=self.reader, text='Комментарий'))
+        self.post.text = 'Новый текст'
+        self.assert_changed(self.urls, self.post.save)
+
+    def test_follow_invalidates_author_pages(self):
+        self.assert_changed(self.urls[2:], lambda: Follow.objects.create(
+            user=self.reader, author=self.author))
+
+    def test_authorized_index_is_not_conditional(self):
+        self.client.force_login(self.reader)
+        response = self.client.get(self.urls[0])
+        self.assertFalse(response.has_header('ETag'))
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_etag_depends_on_viewer(self):
+        url = self.urls[2]
+        response = self.client.get(url)
+        self.client.force_login(self.reader)
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
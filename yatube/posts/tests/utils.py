@@ -0,0 +1,22 @@
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+@contextmanager
+def run_on_commit(using=DEFAULT_DB_ALIAS):
+    """Выполнить on_commit-колбэки, поставленные внутри блока.
+
+    TestCase не коммитит транзакцию, поэтому без этого колбэки не
+    вызываются никогда. Повторяет captureOnCommitCallbacks из Django 3.2,
+    которого нет в 2.2.
+    """
+    connection = connections[using]
+    start = len(connection.run_on_commit)
+    yield
+    # Колбэки могут ставить новые колбэки: выполняем, пока они есть
+    while len(connection.run_on_commit) > start:
+        pending = connection.run_on_commit[start:]
+        start = len(connection.run_on_commit)
+        for _, callback in pending:
+            callback()
@@ -0,0 +1,150 @@
+"""Фоновая подготовка миниатюр для картинок постов.
+
+Шаблоны не нарезают миниатюры сами: они берут готовый набор
+миниатюр из кэша (см. cached_srcset) или, пока его нет, показывают
+исходную картинку. Нарезка ставится фоновой задачей (см. tasks.py) после
+сохранения поста; THUMBNAIL_PREGENERATE = False её отключает.
+
+Для вариантов из THUMBNAIL_SRCSET задача нарезает ещё и набор ширин
+в нескольких форматах, а готовые URL кладёт в кэш одним значением на
+картинку: тегу post_image хватает одного cache.get, без обращений
+к хранилищу sorl-thumbnail на каждую ширину.
+"""
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from PIL import Image
+from sorl.thumbnail import get_thumbnail
+from sorl.thumbnail import delete as default_delete
+from sorl.thumbnail.images import ImageFile
+
+from .caching import FEED_VERSION_KEY, bump_version, post_version_key
+from .storage import blob_storage
+from .tasks import task
+
+JOB_TIMEOUT = 60 * 5
+
+
+def srcset_key(image_name, variant):
+    return f'thumbnail_srcset:{variant}:{image_name}'
+
+
+def cached_srcset(image_name, variant):
+    """Готовый набор миниатюр для srcset (см. build_srcset) или None."""
+    return cache.get(srcset_key(image_name, variant))
+
+
+def source_width(source):
+    # PIL читает только заголовок файла
+    with source.storage.open(source.name) as file, Image.open(file) as image:
+        return image.width
+
+
+def sizes(column=''):
+    """Атрибут sizes для картинки на всю ширину колонки.
+
+    column - класс колонки Bootstrap вроде col-md-9, в которой стоит
+    картинка, как в шаблонах профиля и поста; пустая строка - картинка
+    прямо в .container. Колонка занимает свою долю .container и ещё
+    теряет отступы; ниже своего брейкпоинта она растягивается на всю
+    ширину.
+    """
+    match = re.fullmatch(r'col-(\w+)-(\d+)', column)
+    start, span = 0, 12
+    if match:
+        start = settings.BOOTSTRAP_CONTAINERS[match[1]][0]
+        span = int(match[2])
+    gutter = settings.BOOTSTRAP_GUTTER
+    rules = []
+    for min_width, container in sorted(
+            settings.BOOTSTRAP_CONTAINERS.values(), reverse=True):
+        width = container - gutter
+        if min_width >= start and span < 12:
+            width = -(-width * span // 12) - gutter
+        rules.append(f'(min-width: {min_width}px) {width}px')
+    return ', '.join(rules + ['100vw'])
+
+
+def build_srcset(source, variant, fallback):
+    """Нарезать ширины варианта во всех форматах.
+
+    Ширины больше исходной картинки пропускаются: растянутая миниатюра
+    весит больше и не становится чётче.
+    """
+    geometry, options = settings.THUMBNAIL_GEOMETRIES[variant]
+    width, height = map(int, geometry.split('x'))
+    config = settings.THUMBNAIL_SRCSET[variant]
+    limit = source_width(source)
+    widths = [
+        size for size in config['widths'] if size <= limit
+    ] or config['widths'][:1]
+    sources = []
+    for image_format in config['formats']:
+        candidates = []
+        for size in widths:
+            thumbnail = get_thumbnail(
+                source, f'{size}x{round(size * height / width)}',
+                **{**dict(options), 'format': image_format})
+            candidates.append(f'{thumbnail.url} {size}w')
+        sources.append({
+            'type': f'image/{image_format.lower()}',
+            'srcset': ', '.join(candidates),
+        })
+    return {
+        'src': fallback.url,
+        'width': fallback.width,
+        'height': fallback.height,
+        'srcset': sources.pop()['srcset'],
+        'sources': sources,
+    }
+
+
+def generate(post_id, image_name):
+    # Ключ миниатюры включает хранилище исходника: то же, что у Post.image
+    source = ImageFile(image_name, blob_storage)
+    for variant, (geometry, options) in settings.THUMBNAIL_GEOMETRIES.items():
+        thumbnail = get_thumbnail(source, geometry, **options)
+        if variant in settings.THUMBNAIL_SRCSET:
+            cache.set(
+                srcset_key(image_name, variant),
+                build_srcset(source, variant, thumbnail), None)
+    # Карточки с исходной картинкой вместо миниатюры больше не нужны
+    bump_version(post_version_key(post_id))
+    bump_version(FEED_VERSION_KEY)
+
+
+# Нарезка долгая и пишет только файлы и хранилище sorl-thumbnail
+@task(atomic=False)
+def run_job(post_id, image_name):
+    generate(post_id, image_name)
+    # Если все попытки упали, блокировка остаётся до истечения
+    # JOB_TIMEOUT, чтобы битая картинка не ставилась в очередь на каждой
+    # отрисовке ленты
+    cache.delete(job_key(image_name))
+
+
+def job_key(image_name):
+    return f'thumbnail_job:{image_name}'
+
+
+def schedule(post):
+    """Поставить нарезку миниатюр поста после коммита транзакции."""
+    if not post.image or not settings.THUMBNAIL_PREGENERATE:
+        return
+    post_id, image_name = post.pk, post.image.name
+
+    def submit():
+        if cache.add(job_key(image_name), True, JOB_TIMEOUT):
+            run_job.delay(post_id, image_name)
+
+    transaction.on_commit(submit)
+
+
+def delete(image_name):
+    """Удалить миниатюры картинки и их URL из кэша."""
+    default_delete(ImageFile(image_name, blob_storage), delete_file=False)
+    cache.delete_many([
+        srcset_key(image_name, variant)
+        for variant in settings.THUMBNAIL_SRCSET])
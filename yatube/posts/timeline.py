@@ -0,0 +1,82 @@
+"""Материализованная лента подписок (fan-out on write).
+
+Новая запись автора сразу раскладывается в TimelineEntry всех его
+подписчиков, и /follow/ читает ленту одним индексом по (user, pub_date).
+Для авторов с числом подписчиков больше TIMELINE_FANOUT_LIMIT раскладка
+не делается: их записи подмешиваются в ленту при чтении. Когда автор
+опускается до лимита, подмешивание прекращается, поэтому его записи
+раскладываются по лентам подписчиков задним числом (см. refresh_follows).
+"""
+from django.conf import settings
+
+from .models import Follow, Post, TimelineEntry, User, UserStats
+
+
+def is_celebrity(author):
+    stats = UserStats.objects.for_user(author)
+    return stats.followers_count > settings.TIMELINE_FANOUT_LIMIT
+
+
+def fan_out(post):
+    if is_celebrity(post.author):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+         for user_id in followers.iterator()),
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True)
+
+
+def backfill(user, author):
+    if is_celebrity(author):
+        return
+    posts = author.posts.order_by('-pub_date').values_list('pk', 'pub_date')
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user=user, post_id=pk, pub_date=pub_date)
+         for pk, pub_date in posts[:settings.TIMELINE_BACKFILL_SIZE]),
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True)
+
+
+def backfill_followers(author):
+    """Дозаполнить ленты всех подписчиков автора, например после
+    массовой загрузки постов в обход сигналов."""
+    if is_celebrity(author):
+        return
+    for follow in Follow.objects.filter(author=author).select_related('user'):
+        backfill(follow.user, author)
+
+
+def refresh_follows(user_ids=(), author_ids=()):
+    """Пересчитать счётчики подписок и дозаполнить ленты подписчиков
+    авторов, которые перестали быть знаменитостями."""
+    limit = settings.TIMELINE_FANOUT_LIMIT
+    celebrities = list(UserStats.objects.filter(
+        user_id__in=author_ids, followers_count__gt=limit,
+    ).values_list('user_id', flat=True))
+    UserStats.objects.refresh_follows(user_ids, author_ids)
+    if celebrities:
+        for author in User.objects.filter(
+                pk__in=celebrities, stats__followers_count__lte=limit):
+            backfill_followers(author)
+
+
+def prune(user_id, author_ids):
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id__in=author_ids).delete()
+
+
+def key_sources(user):
+    """Источники ключей ленты для CursorPaginator."""
+    sources = [
+        (TimelineEntry.objects.filter(user=user), 'pub_date', 'post_id')]
+    celebrities = list(Follow.objects.filter(
+        user=user,
+        author__stats__followers_count__gt=settings.TIMELINE_FANOUT_LIMIT,
+    ).values_list('author_id', flat=True))
+    if celebrities:
+        sources.append(
+            (Post.objects.filter(author_id__in=celebrities), 'pub_date', 'pk'))
+    return sources
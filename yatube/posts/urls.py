@@ -7,6 +7,9 @@ urlpatterns = [
     path('new/', views.new_post, name='new_post'),
     path('group/<slug:slug>/', views.group_posts, name='group_posts'),
     path('follow/', views.follow_index, name='follow_index'),
+    path('follow/bulk/', views.follow_bulk, name='follow_bulk'),
+    path('search/', views.search, name='search'),
+    path('staff/export/<str:kind>/', views.export, name='export'),
     path('<str:username>/', views.profile, name='profile'),
     path('<str:username>/follow/',
          views.profile_follow, name='profile_follow'),
@@ -15,6 +18,8 @@ urlpatterns = [
     path('<str:username>/<int:post_id>/', views.post_view, name='post'),
     path('<str:username>/<int:post_id>/edit/',
          views.post_edit, name='post_edit'),
+    path('<str:username>/<int:post_id>/comments/',
+         views.post_comments, name='post_comments'),
     path('<str:username>/<int:post_id>/comment/',
          views.add_comment,
          name='add_comment'),
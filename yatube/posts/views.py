@@ -1,53 +1,82 @@
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
+from django.db import transaction
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
+from django.template.loader import render_to_string
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_POST
 
+from yatube.db_router import primary_db
 from yatube.settings import PAGE_SIZE
 
+from . import follows, thumbnails, timeline
+from .caching import feed_body_key, get_feed_body, set_feed_body
+from .conditional import (conditional_page, group_page_etag,
+                          index_page_etag, post_page_etag, profile_page_etag)
+from .export import FORMATS, KINDS, lines
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
+from .models import Group, Post, User, UserStats
+from .paginator import extra_query, get_comments_page, get_page
+from .search import SearchResults
 
 
-@cache_page(20)
+@conditional_page(index_page_etag)
 def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, PAGE_SIZE)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    return render(request, 'index.html', {'page': page})
-
-
+    # Тело ленты у всех анонимных посетителей одинаковое и кэшируется
+    # по версии ленты; шапка с пользователем рисуется на каждый запрос
+    context = {}
+    key = feed_body_key(request) if request.user.is_anonymous else None
+    feed_body, current = get_feed_body(key) if key else (None, True)
+    if feed_body is None:
+        context['page'] = get_page(
+            request, Post.objects.for_feed(), PAGE_SIZE)
+        feed_body = render_to_string(
+            'includes/feed.html', context, request)
+        if key:
+            set_feed_body(key, feed_body)
+    context['feed_body'] = feed_body
+    response = render(request, 'index.html', context)
+    if not current:
+        # Тело старой версии уходит с ETag новой: ни браузер, ни CDN
+        # не должны его запомнить
+        patch_cache_control(response, no_store=True)
+    return response
+
+
+@conditional_page(group_page_etag)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
-    paginator = Paginator(post_list, PAGE_SIZE)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_list = group.posts.for_feed()
+    page = get_page(request, post_list, PAGE_SIZE)
     return render(request, 'group.html', {'page': page, 'group': group})
 
 
+@conditional_page(profile_page_etag)
 def profile(request, username):
     author = get_object_or_404(User, username=username)
-    post_list = author.posts.all()
+    post_list = author.posts.for_feed()
     following = False
     if request.user.is_anonymous is True:
         pass
     elif request.user.is_authenticated is True:
         following = request.user.follower.filter(author=author).exists()
-    paginator = Paginator(post_list, PAGE_SIZE)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    page = get_page(request, post_list, PAGE_SIZE)
     context = {
         'page': page,
         'author': author,
+        'stats': UserStats.objects.for_user(author),
         'following': following,
     }
     return render(request, 'profile.html', context)
 
 
+@conditional_page(post_page_etag)
 def post_view(request, username, post_id):
-    post = get_object_or_404(Post, author__username=username, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.for_feed(), author__username=username, pk=post_id)
     author = post.author
     form = CommentForm(request.POST or None)
     following = False
@@ -55,27 +84,54 @@ def post_view(request, username, post_id):
         pass
     elif request.user.follower.filter(author=author):
         following = True
+    comments, comments_cursor = get_comments_page(
+        post.comments.select_related('author'),
+        request.GET.get('comments'), settings.COMMENTS_PAGE_SIZE)
     context = {
         'author': author,
+        'stats': UserStats.objects.for_user(author),
         'post': post,
+        'comments': comments,
+        'comments_cursor': comments_cursor,
         'following': following,
         'form': form
     }
     return render(request, 'post.html', context)
 
 
+def post_comments(request, username, post_id):
+    """Следующая порция комментариев для подгрузки на странице поста."""
+    post = get_object_or_404(
+        Post.objects.select_related('author'),
+        author__username=username, pk=post_id)
+    comments, comments_cursor = get_comments_page(
+        post.comments.select_related('author'),
+        request.GET.get('cursor'), settings.COMMENTS_PAGE_SIZE)
+    context = {
+        'post': post,
+        'comments': comments,
+        'comments_cursor': comments_cursor,
+    }
+    return render(request, 'includes/comments_list.html', context)
+
+
 @login_required
+@primary_db
 def new_post(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
     if form.is_valid():
-        post = form.save(commit=False)
-        post.author = request.user
-        post.save()
+        # Транзакция только на запись: BEGIN IMMEDIATE ждёт писателей
+        with transaction.atomic():
+            post = form.save(commit=False)
+            post.author = request.user
+            post.save()
+            thumbnails.schedule(post)
         return redirect('index')
     return render(request, 'new.html', {'form': form, 'func': 'new_post'})
 
 
 @login_required
+@primary_db
 def post_edit(request, username, post_id):
     if request.user.username == username:
         post = get_object_or_404(Post, author__username=username, pk=post_id)
@@ -84,6 +140,7 @@ def post_edit(request, username, post_id):
         )
         if form.is_valid():
             post.save()
+            thumbnails.schedule(post)
             return redirect('post', username=username, post_id=post_id)
 
         return render(request, 'new.html',
@@ -92,49 +149,94 @@ def post_edit(request, username, post_id):
 
 
 @login_required
+@primary_db
 def add_comment(request, username, post_id):
     form = CommentForm(request.POST or None)
     if form.is_valid():
-        comment = form.save(commit=False)
-        comment.author = request.user
-        comment.post = get_object_or_404(
-            Post, author__username=username, pk=post_id
-        )
-        comment.save()
+        with transaction.atomic():
+            comment = form.save(commit=False)
+            comment.author = request.user
+            comment.post = get_object_or_404(
+                Post, author__username=username, pk=post_id
+            )
+            comment.save()
         return redirect('post', username=username, post_id=post_id)
     return render(request, 'comments.html', {'form': form})
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    paginator = Paginator(SearchResults(query), PAGE_SIZE)
+    page = paginator.get_page(request.GET.get('page'))
+    page.extra_query = extra_query(request)
+    return render(request, 'search.html', {'page': page, 'query': query})
+
+
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(post_list, PAGE_SIZE)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    page = get_page(request, Post.objects.for_feed(), PAGE_SIZE,
+                    key_sources=timeline.key_sources(request.user))
     return render(request, 'follow.html', {'page': page})
 
 
+def author_id_or_404(username):
+    author_id = User.objects.filter(
+        username=username).values_list('pk', flat=True).first()
+    if author_id is None:
+        raise Http404
+    return author_id
+
+
 @login_required
+@primary_db
 def profile_follow(request, username):
-    author = User.objects.get(username=username)
-    user = request.user
-    if user != author:
-        Follow.objects.get_or_create(
-            user=user,
-            author=author)
+    follows.follow(request.user, [author_id_or_404(username)])
     return redirect('follow_index')
 
 
 @login_required
+@primary_db
 def profile_unfollow(request, username):
-    author = User.objects.get(username=username)
-    followship = Follow.objects.get(
-        user=request.user,
-        author=author)
-    followship.delete()
+    follows.unfollow(request.user, [author_id_or_404(username)])
     return redirect('index')
 
 
+@login_required
+@primary_db
+@require_POST
+def follow_bulk(request):
+    """Подписка или отписка сразу от нескольких авторов.
+
+    Принимает поля author (имя автора, можно несколько раз) и action:
+    follow или unfollow. Возвращает число авторов, на которых
+    пользователь теперь подписан, или число удалённых подписок.
+    """
+    action = request.POST.get('action', 'follow')
+    if action not in ('follow', 'unfollow'):
+        return JsonResponse({'error': 'unknown action'}, status=400)
+    author_ids = User.objects.filter(
+        username__in=request.POST.getlist('author')
+    ).values_list('pk', flat=True)
+    if action == 'follow':
+        changed = len(follows.follow(request.user, author_ids))
+    else:
+        changed = follows.unfollow(request.user, author_ids)
+    return JsonResponse({action: changed})
+
+
+@staff_member_required
+def export(request, kind):
+    fmt = request.GET.get('format', 'jsonl')
+    if kind not in KINDS or fmt not in FORMATS:
+        raise Http404
+    content_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(
+        lines(kind, fmt), content_type=f'{content_type}; charset=utf-8')
+    response['Content-Disposition'] = (
+        f'attachment; filename="{kind}.{fmt}"')
+    return response
+
+
 def page_not_found(request, exception):
     return render(
         request,
@@ -1,10 +1,24 @@
+from django import forms
 from django.contrib.auth import get_user_model
 from django.contrib.auth.forms import UserCreationForm
 
 User = get_user_model()
 
+# Первые части служебных адресов: профиль пользователя с таким именем
+# перекрыли бы страницы сайта
+RESERVED_USERNAMES = frozenset({
+    'about', 'admin', 'api', 'auth', 'follow', 'group', 'new', 'posts',
+    'search', 'staff',
+})
+
 
 class CreationForm(UserCreationForm):
     class Meta(UserCreationForm.Meta):
         model = User
         fields = ('first_name', 'last_name', 'username', 'email')
+
+    def clean_username(self):
+        username = self.cleaned_data['username']
+        if username.lower() in RESERVED_USERNAMES:
+            raise forms.ValidationError('Это имя занято адресом сайта.')
+        return username
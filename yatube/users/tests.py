@@ -0,0 +1,18 @@
+from django.test import TestCase
+
+from .forms import CreationForm
+
+
+class CreationFormTest(TestCase):
+    def form(self, username):
+        return CreationForm({
+            'username': username, 'password1': 'Sl0zhnyi-parol',
+            'password2': 'Sl0zhnyi-parol'})
+
+    def test_reserved_usernames(self):
+        for username in ('api', 'Staff', 'follow', 'Posts'):
+            with self.subTest(username=username):
+                form = self.form(username)
+                self.assertFalse(form.is_valid())
+                self.assertIn('username', form.errors)
+        self.assertTrue(self.form('apiary').is_valid())
@@ -0,0 +1,31 @@
+"""PostgreSQL с проверкой постоянных соединений.
+
+При CONN_MAX_AGE соединение живёт между запросами, и база могла
+закрыть его за это время (перезапуск, pgbouncer, таймаут простоя).
+С CONN_HEALTH_CHECKS перед первым обращением к базе в каждом запросе
+соединение проверяется SELECT 1 и при ошибке открывается заново,
+а не роняет запрос.
+"""
+from django.db.backends.postgresql import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    health_check_done = False
+
+    def close_if_unusable_or_obsolete(self):
+        # Вызывается в начале и в конце каждого запроса
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def ensure_connection(self):
+        if (self.connection is not None and not self.health_check_done
+                and not self.in_atomic_block
+                and self.settings_dict.get('CONN_HEALTH_CHECKS')):
+            self.health_check_done = True
+            if not self.is_usable():
+                self.close()
+        super().ensure_connection()
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
@@ -0,0 +1,22 @@
+"""SQLite с прагмами из settings_dict['PRAGMAS'] на каждом соединении.
+
+Транзакции открываются BEGIN IMMEDIATE: писатель берёт блокировку
+сразу и при занятой базе ждёт busy_timeout. Обычный BEGIN берёт её
+только на первой записи, и если другой писатель успел закоммитить,
+SQLite отвечает "database is locked" без ожидания.
+
+Зато и atomic() только с чтением ждёт писателей, поэтому транзакцию
+открывают лишь вокруг записи (см. views.new_post, @task(atomic=False)).
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.settings_dict.get('PRAGMAS', {}).items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
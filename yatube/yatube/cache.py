@@ -0,0 +1,277 @@
+"""Настройка общего кэша из окружения и кэш-бэкенд по протоколу Redis.
+
+Все воркеры gunicorn на одной машине должны видеть один кэш, поэтому
+бэкенд задаётся переменной CACHE_URL:
+
+    locmem://                   - кэш в памяти процесса (по умолчанию)
+    file:///var/tmp/yatube      - файловый кэш, общий для воркеров
+    memcached://127.0.0.1:11211 - memcached (нужен python-memcached)
+    redis://127.0.0.1:6379/0    - Redis или локальная замена из
+                                  yatube.cache_server
+    standin://                  - замена Redis, поднятая прямо в процессе;
+                                  режим для прогона тестов через RedisCache
+"""
+import pickle
+import select
+import socket
+import threading
+from urllib.parse import urlsplit
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'memcached': 'django.core.cache.backends.memcached.MemcachedCache',
+    'redis': 'yatube.cache.RedisCache',
+}
+
+
+def cache_from_url(url, key_prefix=''):
+    """Словарь для settings.CACHES по строке вида scheme://location."""
+    if url.startswith('standin://'):
+        from yatube.cache_server import CacheServer
+        url = CacheServer().start().url
+    parts = urlsplit(url)
+    if parts.scheme not in BACKENDS:
+        raise ValueError(f'Неизвестный кэш-бэкенд: {url}')
+    config = {
+        'BACKEND': BACKENDS[parts.scheme],
+        'KEY_PREFIX': key_prefix,
+    }
+    if parts.scheme == 'file':
+        config['LOCATION'] = parts.path
+    elif parts.scheme in ('memcached', 'redis'):
+        config['LOCATION'] = parts.netloc + parts.path
+    elif parts.netloc:
+        config['LOCATION'] = parts.netloc
+    return config
+
+
+# INCRBY только для существующего ключа, как incr() в кэшах Django;
+# проверка и сдвиг идут одной командой, без гонки между ними
+INCR_IF_EXISTS = (
+    "if redis.call('EXISTS', KEYS[1]) == 1 then "
+    "return redis.call('INCRBY', KEYS[1], ARGV[1]) end "
+    "return false")
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisConnection:
+    """Минимальный клиент протокола RESP поверх одного сокета."""
+
+    def __init__(self, host, port, db, timeout):
+        self.sock = socket.create_connection((host, port), timeout)
+        self.file = self.sock.makefile('rb')
+        if db:
+            self.execute('SELECT', db)
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def is_stale(self):
+        """Сервер закрыл соединение, пока оно лежало без дела.
+
+        Между командами ответов быть не должно, поэтому читаемый сокет
+        означает конец соединения.
+        """
+        readable, _, _ = select.select([self.sock], [], [], 0)
+        return bool(readable)
+
+    @staticmethod
+    def pack(*args):
+        chunks = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            chunks.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        return b''.join(chunks)
+
+    def read_reply(self):
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError('Соединение с кэшем закрыто')
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode()
+        if kind == b'-':
+            raise RedisError(rest.decode())
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            return self.file.read(length + 2)[:-2]
+        if kind == b'*':
+            length = int(rest)
+            if length < 0:
+                return None
+            return [self.read_reply() for _ in range(length)]
+        raise RedisError(f'Непонятный ответ: {line!r}')
+
+    def execute(self, *args):
+        self.sock.sendall(self.pack(*args))
+        return self.read_reply()
+
+    def pipeline(self, commands):
+        self.sock.sendall(b''.join(self.pack(*args) for args in commands))
+        return [self.read_reply() for _ in commands]
+
+
+class RedisCache(BaseCache):
+    """Кэш Django в Redis без сторонних библиотек.
+
+    Целые числа хранятся как есть, чтобы incr() был атомарным INCRBY,
+    остальные значения - в pickle.
+    """
+
+    def __init__(self, server, params):
+        super().__init__(params)
+        host, _, rest = server.partition(':')
+        port, _, db = rest.partition('/')
+        self.host = host or '127.0.0.1'
+        self.port = int(port or 6379)
+        self.db = int(db or 0)
+        self.socket_timeout = params.get('OPTIONS', {}).get(
+            'SOCKET_TIMEOUT', 5)
+        self.local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None and connection.is_stale():
+            self.close()
+            connection = None
+        if connection is None:
+            connection = RedisConnection(
+                self.host, self.port, self.db, self.socket_timeout)
+            self.local.connection = connection
+        return connection
+
+    def _call(self, method, *args, idempotent=True):
+        """Выполнить команду с одной повторной попыткой.
+
+        Если соединение оборвалось после отправки, сервер мог успеть
+        выполнить команду, поэтому повторяются только команды, которые
+        безопасно выполнить дважды. Остальные повторяются, только если
+        ошибка случилась при подключении.
+        """
+        for attempt in range(2):
+            connection = None
+            try:
+                connection = self._connection()
+                return getattr(connection, method)(*args)
+            except (ConnectionError, socket.timeout, OSError):
+                self.close()
+                if attempt or (connection is not None and not idempotent):
+                    raise
+
+    def _execute(self, *args, idempotent=True):
+        return self._call('execute', *args, idempotent=idempotent)
+
+    @staticmethod
+    def encode(value):
+        if type(value) is int:
+            return str(value).encode()
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def decode(data):
+        if data is None:
+            return None
+        if data[:1] == b'\x80':
+            return pickle.loads(data)
+        return int(data)
+
+    def _timeout_ms(self, timeout):
+        """Время жизни в миллисекундах; None - хранить без срока."""
+        if timeout == DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return None
+        return max(int(timeout * 1000), 1)
+
+    def _set_args(self, key, value, timeout):
+        args = ['SET', key, self.encode(value)]
+        timeout = self._timeout_ms(timeout)
+        if timeout is not None:
+            args += ['PX', timeout]
+        return args
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        args = self._set_args(self._key(key, version), value, timeout)
+        return self._execute(*args, 'NX', idempotent=False) == 'OK'
+
+    def get(self, key, default=None, version=None):
+        value = self.decode(self._execute('GET', self._key(key, version)))
+        return default if value is None else value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._execute(*self._set_args(self._key(key, version), value, timeout))
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        timeout = self._timeout_ms(timeout)
+        if timeout is None:
+            return bool(self._execute('PERSIST', key)) or bool(
+                self._execute('EXISTS', key))
+        return bool(self._execute('PEXPIRE', key, timeout))
+
+    def delete(self, key, version=None):
+        self._execute('DEL', self._key(key, version))
+
+    def has_key(self, key, version=None):
+        return bool(self._execute('EXISTS', self._key(key, version)))
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self._execute(
+            'MGET', *[self._key(key, version) for key in keys])
+        return {
+            key: self.decode(value)
+            for key, value in zip(keys, values) if value is not None
+        }
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        if data:
+            self._call('pipeline', [
+                self._set_args(self._key(key, version), value, timeout)
+                for key, value in data.items()
+            ])
+        return []
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        if keys:
+            self._execute('DEL', *keys)
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        value = self._execute(
+            'EVAL', INCR_IF_EXISTS, 1, key, delta, idempotent=False)
+        if value is None:
+            raise ValueError(f"Key '{key}' not found")
+        return value
+
+    def clear(self):
+        self._execute('FLUSHDB')
+
+    def close(self, **kwargs):
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None:
+            try:
+                connection.close()
+            except OSError:
+                pass
+            self.local.connection = None
@@ -0,0 +1,199 @@
+"""Локальная замена Redis для разработки и тестов.
+
+Понимает подмножество протокола RESP, которое использует
+yatube.cache.RedisCache. Запуск отдельным процессом, общим для всех
+воркеров на машине:
+
+    python -m yatube.cache_server --port 6380
+
+В тестах сервер поднимается в том же процессе через CacheServer.start().
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+from yatube.cache import INCR_IF_EXISTS
+
+
+class Store:
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.lock = threading.Lock()
+
+    def _alive(self, key):
+        expires = self.expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def command(self, name, *args):
+        with self.lock:
+            handler = getattr(self, 'cmd_' + name.lower(), None)
+            if handler is None:
+                return Error(f'ERR unknown command {name}')
+            return handler(*args)
+
+    def cmd_ping(self, *args):
+        return Status('PONG')
+
+    def cmd_select(self, db):
+        return Status('OK')
+
+    def cmd_get(self, key):
+        return self.data[key] if self._alive(key) else None
+
+    def cmd_mget(self, *keys):
+        return [self.cmd_get(key) for key in keys]
+
+    def cmd_set(self, key, value, *options):
+        options = [option.upper() for option in options]
+        expires = None
+        if b'PX' in options:
+            ms = int(options[options.index(b'PX') + 1])
+            expires = time.monotonic() + ms / 1000
+        if b'EX' in options:
+            seconds = int(options[options.index(b'EX') + 1])
+            expires = time.monotonic() + seconds
+        if b'NX' in options and self._alive(key):
+            return None
+        self.data[key] = value
+        self.expires.pop(key, None)
+        if expires is not None:
+            self.expires[key] = expires
+        return Status('OK')
+
+    def cmd_del(self, *keys):
+        deleted = 0
+        for key in keys:
+            if self._alive(key):
+                deleted += 1
+                del self.data[key]
+                self.expires.pop(key, None)
+        return deleted
+
+    def cmd_exists(self, *keys):
+        return sum(1 for key in keys if self._alive(key))
+
+    def cmd_incrby(self, key, delta):
+        try:
+            value = int(self.data[key]) if self._alive(key) else 0
+            value += int(delta)
+        except ValueError:
+            return Error('ERR value is not an integer or out of range')
+        self.data[key] = str(value).encode()
+        return value
+
+    def cmd_eval(self, script, numkeys, *args):
+        # Lua здесь нет: поддерживается только скрипт из RedisCache
+        if script.decode() != INCR_IF_EXISTS or int(numkeys) != 1:
+            return Error('ERR unsupported script')
+        key, delta = args
+        return self.cmd_incrby(key, delta) if self._alive(key) else None
+
+    def cmd_pexpire(self, key, ms):
+        if not self._alive(key):
+            return 0
+        self.expires[key] = time.monotonic() + int(ms) / 1000
+        return 1
+
+    def cmd_persist(self, key):
+        if not self._alive(key) or key not in self.expires:
+            return 0
+        del self.expires[key]
+        return 1
+
+    def cmd_flushdb(self, *args):
+        self.data.clear()
+        self.expires.clear()
+        return Status('OK')
+
+
+class Status(str):
+    pass
+
+
+class Error(str):
+    pass
+
+
+def encode(reply):
+    if reply is None:
+        return b'$-1\r\n'
+    if isinstance(reply, Error):
+        return b'-%s\r\n' % reply.encode()
+    if isinstance(reply, Status):
+        return b'+%s\r\n' % reply.encode()
+    if isinstance(reply, int):
+        return b':%d\r\n' % reply
+    if isinstance(reply, list):
+        return b'*%d\r\n' % len(reply) + b''.join(map(encode, reply))
+    return b'$%d\r\n%s\r\n' % (len(reply), reply)
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        while True:
+            command = self.read_command()
+            if not command:
+                return
+            name = command[0].decode()
+            if name.upper() == 'QUIT':
+                self.wfile.write(encode(Status('OK')))
+                return
+            try:
+                reply = self.server.store.command(name, *command[1:])
+            except (TypeError, ValueError, IndexError):
+                reply = Error(f'ERR wrong arguments for {name}')
+            self.wfile.write(encode(reply))
+
+
+class CacheServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0):
+        super().__init__((host, port), Handler)
+        self.store = Store()
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return f'redis://{host}:{port}/0'
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6380)
+    args = parser.parse_args()
+    server = CacheServer(args.host, args.port)
+    print(f'Кэш-сервер слушает {server.url}')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Чтение с реплик и запись в основную базу.
+
+ReplicaRouter отправляет чтение на одну из REPLICA_DATABASES, но только
+внутри запроса, который пропустил ReplicaRoutingMiddleware: команды,
+миграции и фоновые потоки всегда работают с основной базой. Реплику
+middleware выбирает один раз на запрос, чтобы все его чтения видели
+одно и то же состояние.
+
+Запрос читает из основной базы, если:
+- это не GET/HEAD/OPTIONS;
+- view обёрнут в primary_db (он читает то, что сейчас же запишет);
+- у посетителя есть кука недавней записи. Её ставит ответ на запрос,
+  который что-то записал по действию посетителя (не GET или view
+  в primary_db), и держится она REPLICA_STICKY_SECONDS: пока реплика
+  догоняет, автор видит свои изменения. Попутные записи вроде сохранения
+  сессии куку не ставят;
+- кто-то недавно сдвинул версии кэша (см. note_write). Страница,
+  прочитанная с отстающей реплики, иначе закэшировалась бы под новой
+  версией и осталась бы устаревшей до конца срока кэша.
+"""
+import random
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+
+STICKY_COOKIE = 'primary_db'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+RECENT_WRITE_KEY = 'replica_recent_write'
+
+current = ContextVar('db_routing', default=None)
+
+
+def note_write():
+    """Читать всем из основной базы ближайшие REPLICA_STICKY_SECONDS.
+
+    Вызывается после коммита изменения, которое сдвигает версии кэша.
+    """
+    if settings.REPLICA_DATABASES:
+        cache.set(RECENT_WRITE_KEY, True, settings.REPLICA_STICKY_SECONDS)
+
+
+def recent_write_keys():
+    """Ключи, которые get_versions читает вместе с версиями."""
+    return [RECENT_WRITE_KEY] if settings.REPLICA_DATABASES else []
+
+
+def use_primary():
+    """Дочитать текущий запрос из основной базы.
+
+    Нужен, если запись случилась, пока запрос уже шёл по реплике: версии
+    кэша он прочитает новые, значит, и строки должен прочитать свежие.
+    """
+    state = current.get()
+    if state is not None:
+        state.primary = True
+
+
+class RoutingState:
+    def __init__(self, primary, writing, replica='default'):
+        self.primary = primary
+        self.replica = replica
+        # Записи в этом запросе - действие посетителя, а не попутные
+        self.writing = writing
+        self.wrote = False
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = current.get()
+        if state is None or state.primary:
+            return 'default'
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = current.get()
+        if state is not None and state.writing:
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики - копии основной базы, связи между ними допустимы
+        return True
+
+
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        writing = request.method not in SAFE_METHODS
+        state = RoutingState(
+            primary=writing or STICKY_COOKIE in request.COOKIES
+            or bool(settings.REPLICA_DATABASES and cache.get(
+                RECENT_WRITE_KEY)),
+            writing=writing)
+        if settings.REPLICA_DATABASES and not state.primary:
+            state.replica = random.choice(settings.REPLICA_DATABASES)
+        token = current.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        if state.wrote:
+            response.set_cookie(
+                STICKY_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True, samesite='Lax')
+        return response
+
+
+def primary_db(view):
+    """Читать в этом view из основной базы; его записи - действия
+    посетителя и ставят куку недавней записи."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        state = current.get()
+        if state is None:
+            return view(request, *args, **kwargs)
+        primary, writing = state.primary, state.writing
+        state.primary = state.writing = True
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            state.primary, state.writing = primary, writing
+    return wrapper
@@ -11,6 +11,10 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import sys
+
+from yatube.cache import cache_from_url
+from yatube.database import database_from_url
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -50,6 +54,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'yatube.timing.ServerTimingMiddleware',
+    'yatube.db_router.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -65,7 +71,7 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "BACKEND": "yatube.timing.TimedDjangoTemplates",
         "DIRS": [TEMPLATES_DIR],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -85,13 +91,25 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# База задаётся через DATABASE_URL (см. yatube/database.py)
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+    'default': database_from_url(os.environ.get(
+        'DATABASE_URL', 'sqlite:///' + os.path.join(BASE_DIR, 'db.sqlite3'))),
 }
 
+# Реплики только для чтения через запятую (см. yatube/db_router.py):
+# адреса в том же виде, что DATABASE_URL, или пути к файлам SQLite.
+# В тестах они указывают на основную базу
+REPLICA_DATABASES = []
+for number, url in enumerate(
+        filter(None, os.environ.get('DATABASE_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = database_from_url(
+        url, TEST={'MIRROR': 'default'})
+    REPLICA_DATABASES.append(f'replica{number}')
+DATABASE_ROUTERS = ['yatube.db_router.ReplicaRouter']
+# Сколько секунд после записи посетитель читает из основной базы
+REPLICA_STICKY_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -149,12 +167,103 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 
 # Количество записей на одной странице паджинатора
 PAGE_SIZE = 10
+# Сколько комментариев показывать под постом за один раз
+COMMENTS_PAGE_SIZE = 20
 
+# Общий для всех воркеров кэш задаётся через CACHE_URL (см. yatube/cache.py).
+# Префикс ключей включает идентификатор релиза, чтобы после выкладки
+# новая версия кода не читала кэш, записанный старой
+RELEASE_ID = os.environ.get('RELEASE_ID', 'dev')
 CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    'default': cache_from_url(
+        os.environ.get('CACHE_URL', 'locmem://'),
+        key_prefix=f'yatube:{RELEASE_ID}',
+    ),
 }
 INTERNAL_IPS = [
     "127.0.0.1",
 ]
+
+# Лента подписок: авторы, у которых подписчиков больше лимита, не
+# раскладываются по лентам при публикации, а подмешиваются при чтении
+TIMELINE_FANOUT_LIMIT = 1000
+# Сколько последних записей автора добавить в ленту при подписке
+TIMELINE_BACKFILL_SIZE = 1000
+TIMELINE_BATCH_SIZE = 500
+
+# Кэш ленты на главной: сколько секунд тело считается свежим, сколько
+# ещё его можно отдавать, пока один запрос рисует новое, и на сколько
+# этот запрос захватывает блокировку
+FEED_CACHE_TIMEOUT = 60
+FEED_CACHE_STALE_TIMEOUT = 300
+FEED_CACHE_LOCK_TIMEOUT = 10
+
+# Загруженные картинки постов уменьшаются до IMAGE_MAX_SIZE
+# и пересохраняются в IMAGE_FORMAT ('JPEG' или 'WEBP') с качеством
+# IMAGE_QUALITY в пуле из IMAGE_WORKERS процессов; 0 - в потоке запроса
+IMAGE_MAX_SIZE = (1920, 1920)
+IMAGE_FORMAT = 'JPEG'
+IMAGE_QUALITY = 85
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+
+# Миниатюры картинок постов, которые используют шаблоны. Они нарезаются
+# заранее фоновой задачей после сохранения поста
+THUMBNAIL_GEOMETRIES = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+THUMBNAIL_PREGENERATE = os.environ.get('THUMBNAIL_PREGENERATE') != 'off'
+# Наборы ширин для srcset с теми же пропорциями и опциями, что у варианта
+# из THUMBNAIL_GEOMETRIES. Последний формат - запасной для <img>,
+# остальные уходят в <source>
+THUMBNAIL_SRCSET = {
+    'card': {
+        'widths': (360, 720, 960, 1440, 1920),
+        'formats': ('WEBP', 'JPEG'),
+    },
+}
+# Сетка Bootstrap 4 из шаблонов: брейкпоинт -> (min-width, ширина
+# .container) и отступы колонок. Из неё считается атрибут sizes
+BOOTSTRAP_CONTAINERS = {
+    'sm': (576, 540), 'md': (768, 720), 'lg': (992, 960), 'xl': (1200, 1140),
+}
+BOOTSTRAP_GUTTER = 30
+
+# Фоновые задачи (см. posts/tasks.py): sync, thread, process или db.
+# sync выполняет задачи прямо в запросе и годится только для тестов
+TESTING = sys.argv[1:2] == ['test'] or 'pytest' in sys.modules
+TASKS_BACKEND = os.environ.get(
+    'TASKS_BACKEND', 'sync' if TESTING else 'thread')
+TASKS_WORKERS = 4
+TASKS_MAX_ATTEMPTS = 5
+# Задержка перед повтором удваивается с каждой попыткой, секунды
+TASKS_RETRY_DELAY = 1
+TASKS_RETRY_MAX_DELAY = 300
+# Сколько секунд задача из таблицы закреплена за взявшим её воркером
+TASKS_LEASE = 300
+
+# С какого числа строк по статистике админка показывает оценку вместо
+# COUNT(*) по всей таблице
+ADMIN_COUNT_ESTIMATE_THRESHOLD = 10000
+
+# Сколько строк выгрузка забирает из БД за один раз
+EXPORT_CHUNK_SIZE = 2000
+
+# Конфигурация текстового поиска PostgreSQL; в SQLite используется FTS5
+SEARCH_CONFIG = 'russian'
+
+# Замеры запросов: заголовок Server-Timing и строки лога yatube.timing.
+# Чтобы строки попадали в консоль, задайте TIMING_LOG_LEVEL=INFO
+SERVER_TIMING_HEADER = True
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'yatube.timing': {
+            'handlers': ['console'],
+            'level': os.environ.get('TIMING_LOG_LEVEL', 'WARNING'),
+        },
+    },
+}
@@ -0,0 +1,102 @@
+"""Замеры запроса: число SQL-запросов, время в БД и в шаблонах.
+
+ServerTimingMiddleware отдаёт их заголовком Server-Timing, который
+показывают инструменты разработчика браузера, и пишет строкой в лог
+yatube.timing. Время шаблонов считает бэкенд TimedDjangoTemplates,
+поэтому в TEMPLATES должен стоять он.
+"""
+import logging
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger('yatube.timing')
+
+current = ContextVar('request_timing', default=None)
+
+
+class RequestTiming:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Обёртка для connection.execute_wrapper
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        timing = current.get()
+        if timing is None:
+            return super().render(context, request)
+        # Время вложенных шаблонов уже входит во внешний
+        timing.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timing.template_depth -= 1
+            if not timing.template_depth:
+                timing.template_time += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+
+class ServerTimingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timing = RequestTiming()
+        token = current.set(timing)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timing))
+                response = self.get_response(request)
+        finally:
+            current.reset(token)
+        total = time.perf_counter() - started
+        if getattr(settings, 'SERVER_TIMING_HEADER', True):
+            response['Server-Timing'] = ', '.join((
+                f'db;dur={timing.db_time * 1000:.1f};'
+                f'desc="{timing.queries} queries"',
+                f'tpl;dur={timing.template_time * 1000:.1f}',
+                f'total;dur={total * 1000:.1f}',
+            ))
+        logger.info(
+            'method=%s path=%s status=%s queries=%d db_ms=%.1f '
+            'tpl_ms=%.1f total_ms=%.1f',
+            request.method, request.path, response.status_code,
+            timing.queries, timing.db_time * 1000,
+            timing.template_time * 1000, total * 1000,
+            extra={
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'queries': timing.queries,
+                'db_ms': round(timing.db_time * 1000, 1),
+                'tpl_ms': round(timing.template_time * 1000, 1),
+                'total_ms': round(total * 1000, 1),
+            })
+        return response